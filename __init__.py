@@ -1,8 +1,14 @@
+import os as _os
 import sys as _sys
-_sys.path.append("D:\Dropbox\SCIENCE\PhD_Research_Project\Code\ssim_tool")
+
+# ssim_tool and lib are imported as top level modules, so the folder holding them has to be on the path
+_here = _os.path.dirname(_os.path.abspath(__file__))
+if _here not in _sys.path:
+    _sys.path.append(_here)
 
 import ssim_tool
-import distributions
+from ssim_tool import SSIMAnalyse, cab_matrix, distributions, rank_excipients
+from lib.instrument import Instrument
 
 
 """
@@ -14,4 +20,4 @@ for dependency in hard_dependencies:
         __import__(dependency)
     except ImportError as e:
         missing_dependencies.append(dependency)
-"""
\ No newline at end of file
+"""
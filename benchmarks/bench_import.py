@@ -0,0 +1,71 @@
+"""Import-time benchmark guarding the plotting-free analysis core.
+
+Each module is imported in a fresh interpreter. The script fails (exit code 1) if importing it pulls in a plotting or
+widget package, or if its import time on top of pandas and NumPy goes over the budget.
+
+    python benchmarks/bench_import.py [--budget 0.5] [--repeat 5]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Modules that must stay importable with only pandas and NumPy
+CORE_MODULES = ['ssim_tool', 'lib.ingest', 'lib.morphology', 'lib.cache', 'lib.facetindex', 'lib.cubes',
+                'lib.density', 'lib.streaming', 'lib.poses', 'lib.bootstrap', 'lib.cab', 'lib.watch',
+                'lib.synthetic', 'lib.instrument', 'lib.memo']
+HEAVY = ['ipywidgets', 'IPython', 'matplotlib', 'seaborn', 'sklearn', 'scipy']
+
+_PROBE = """
+import json, sys, time
+import numpy, pandas
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{'seconds': elapsed, 'heavy': sorted(m for m in {heavy!r} if m in sys.modules)}}))
+"""
+
+
+def time_import(module, repeat=5):
+    """Returns the best import time of module (beyond pandas and NumPy) and the heavy packages it loaded."""
+    best = None
+    heavy = []
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, '-c', _PROBE.format(module=module, heavy=HEAVY)], cwd=ROOT,
+                             check=True, stdout=subprocess.PIPE, universal_newlines=True).stdout
+        result = json.loads(out.strip().splitlines()[-1])
+        best = result['seconds'] if best is None else min(best, result['seconds'])
+        heavy = result['heavy']
+    return best, heavy
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--budget', type=float, default=0.5, help="Largest import time allowed per module (s)")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--json', default=None, help="Optional file to write the results to")
+    args = parser.parse_args(argv)
+
+    failed = False
+    results = {}
+    for module in CORE_MODULES:
+        seconds, heavy = time_import(module, repeat=args.repeat)
+        results[module] = {'seconds': seconds, 'heavy': heavy}
+        status = 'ok'
+        if heavy:
+            status = 'FAIL imports ' + ', '.join(heavy)
+            failed = True
+        elif seconds > args.budget:
+            status = 'FAIL over budget'
+            failed = True
+        print("{:<18} {:8.3f} s  {}".format(module, seconds, status))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
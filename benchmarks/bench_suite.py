@@ -0,0 +1,171 @@
+"""Benchmark suite of the analysis hot paths on synthetic datasets of growing size.
+
+For every size a probe and an excipient dataset are generated with lib.synthetic, then each stage is timed (best of
+--repeat runs, caches cleared between runs) and its peak Python memory measured in a separate traced run. Results
+are written as JSON so runs can be compared:
+
+    python benchmarks/bench_suite.py --sizes small medium --json before.json
+    python benchmarks/bench_suite.py --sizes small medium --json after.json --compare before.json
+"""
+import argparse
+import datetime
+import json
+import os
+import pickle
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+
+from lib.synthetic import generate  # noqa: E402
+from ssim_tool import SSIMAnalyse  # noqa: E402
+
+# Dataset parameters of each size: facets (pairs = facets ** 2), points along X and Y, degrees between rotations
+SIZES = {'small': {'n_facets': 4, 'grid': 10, 'rotation_step': 30},
+         'medium': {'n_facets': 6, 'grid': 20, 'rotation_step': 15},
+         'large': {'n_facets': 8, 'grid': 40, 'rotation_step': 10}}
+
+
+def _reset(analysis):
+    """Drops the derived caches so every run of a stage starts cold."""
+    analysis._side_stats = {}
+    analysis._cubes = {}
+    analysis._densities.clear()
+    analysis.queries.clear()
+
+
+def stages(probe, excipient):
+    """Returns {name: callable} of the stages timed on already loaded datasets."""
+    energies = list(probe.get_col_options())
+
+    def cab_extraction():
+        _reset(probe)
+        _reset(excipient)
+        probe.cab_extraction(excipient)
+        probe.cab_extraction(excipient, weighted=True)
+
+    def facet_list():
+        _reset(probe)
+        probe.get_facet_list()
+        probe.get_facet_list(weighted=True)
+
+    def heatmap_frames():
+        _reset(probe)
+        for energy in energies:
+            for facet in probe.whole_list:
+                cube = probe.energy_cube(facet, energy)
+                for rotation in cube.rotations:
+                    cube.frame(rotation)
+
+    def distributions():
+        _reset(probe)
+        for energy in energies:
+            probe.describe(energy)
+            probe.pair_statistics(energy, median=True)
+            for facet in probe.whole_list:
+                probe.density(energy, facet)
+
+    def round_trip():
+        # What the pipeline sends back from every worker with --jobs, so an unpicklable attribute fails here too
+        pickle.loads(pickle.dumps(probe, protocol=pickle.HIGHEST_PROTOCOL))
+
+    return {'cab_extraction': cab_extraction, 'get_facet_list': facet_list, 'heatmap_frames': heatmap_frames,
+            'distributions': distributions, 'pickle': round_trip}
+
+
+def measure(function, repeat):
+    """Returns the best wall time of function over repeat runs and the peak traced memory of one more run."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    tracemalloc.start()
+    try:
+        function()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {'seconds': best, 'peak_mb': peak / 2 ** 20}
+
+
+def run_size(size, repeat, work_dir, seed=0):
+    """Generates the datasets of one size and measures every stage on them."""
+    params = SIZES[size]
+    probe_set = generate(os.path.join(work_dir, size, 'probe'), name='API', seed=seed, **params)
+    excipient_set = generate(os.path.join(work_dir, size, 'excipient'), name='EXC', seed=seed + 1, **params)
+    results = {'params': params, 'pairs': len(probe_set['files']), 'rows': probe_set['rows'], 'stages': {}}
+
+    loaded = {}
+
+    def construct():
+        loaded['probe'] = SSIMAnalyse(probe_set['morph_path'], probe_set['data_path'])
+        loaded['excipient'] = SSIMAnalyse(excipient_set['morph_path'], excipient_set['data_path'])
+
+    results['stages']['construction'] = measure(construct, repeat)
+    for name, function in stages(loaded['probe'], loaded['excipient']).items():
+        results['stages'][name] = measure(function, repeat)
+    return results
+
+
+def compare(results, baseline):
+    """Prints the time and memory ratio of every stage against a baseline run (below 1 is an improvement)."""
+    print("\n{:<8} {:<16} {:>10} {:>10}".format('size', 'stage', 'time x', 'memory x'))
+    for size, result in results['sizes'].items():
+        base = baseline.get('sizes', {}).get(size)
+        if base is None:
+            continue
+        for stage, now in result['stages'].items():
+            old = base['stages'].get(stage)
+            if old is None:
+                continue
+            print("{:<8} {:<16} {:>10.2f} {:>10.2f}".format(size, stage, now['seconds'] / old['seconds'],
+                                                            now['peak_mb'] / max(old['peak_mb'], 1e-9)))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', nargs='+', default=['small', 'medium'], choices=list(SIZES))
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--work-dir', default=None, help="Folder for the datasets, a temporary one if omitted")
+    parser.add_argument('--keep', action='store_true', help="Keep the generated datasets")
+    parser.add_argument('--json', default=None, help="Optional file to write the results to")
+    parser.add_argument('--compare', default=None, help="Results of an earlier run to compare against")
+    args = parser.parse_args(argv)
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix='ssim_bench_')
+    results = {'meta': {'time': datetime.datetime.now().isoformat(timespec='seconds'),
+                        'python': platform.python_version(), 'platform': platform.platform(),
+                        'numpy': np.__version__, 'pandas': pd.__version__, 'repeat': args.repeat},
+               'sizes': {}}
+    try:
+        for size in args.sizes:
+            result = run_size(size, args.repeat, work_dir, seed=args.seed)
+            results['sizes'][size] = result
+            print("{} ({} pairs, {} rows per dataset)".format(size, result['pairs'], result['rows']))
+            for stage, measured in result['stages'].items():
+                print("  {:<16} {:8.3f} s {:9.1f} MB".format(stage, measured['seconds'], measured['peak_mb']))
+    finally:
+        if not args.keep and args.work_dir is None:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,119 @@
+import os
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+# Largest number of resampled values held at once by one worker
+MAX_ELEMENTS = 1 << 22
+_SHARED = {}
+
+
+def group_rows(keys, n_groups):
+    """
+    Groups rows by integer key once so every resample is a slice of one sorted array.
+
+    :param obj keys: Group key of every row in [0, n_groups)
+    :param int n_groups: Number of groups
+    :return: tuple : (order, starts, counts) row order sorted by key, and the start and size of every group in it
+    """
+    keys = np.asarray(keys)
+    order = np.argsort(keys, kind='stable')
+    counts = np.bincount(keys, minlength=n_groups)
+    starts = np.cumsum(counts) - counts
+    return order, starts, counts
+
+
+def _init_worker(values, starts, counts):
+    _SHARED.update(values=values, starts=starts, counts=counts)
+
+
+def _worker_block(task):
+    """Worker: _replicate_block on the arrays sent once to the worker process."""
+    return _replicate_block(task, _SHARED['values'], _SHARED['starts'], _SHARED['counts'])
+
+
+def _replicate_block(task, values, starts, counts):
+    """Statistics of n_reps resamples of every group, drawn from one seed."""
+    n_reps, seed, median = task
+    rng = np.random.default_rng(seed)
+    out = np.full((n_reps, len(counts)), np.nan)
+    for g, (start, n) in enumerate(zip(starts, counts)):
+        if n == 0:
+            continue
+        group = values[start:start + n]
+        step = max(1, MAX_ELEMENTS // n)
+        for first in range(0, n_reps, step):
+            b = min(step, n_reps - first)
+            resample = group[rng.integers(0, n, size=(b, n))]
+            out[first:first + b, g] = np.median(resample, axis=1) if median else resample.mean(axis=1)
+    return out
+
+
+def bootstrap_groups(values, keys, n_groups, n_boot=1000, median=False, seed=None, n_jobs=1, block=64):
+    """
+    Bootstrap replicates of the mean (or median) of every group, resampling rows with replacement within each group.
+
+    Replicates are drawn in blocks of block resamples, each block from its own child of the seed, so the result only
+    depends on seed and not on n_jobs. NaN values are dropped before resampling.
+
+    :param obj values: Array of values
+    :param obj keys: Group key of every value in [0, n_groups)
+    :param int n_groups: Number of groups
+    :param int n_boot: Number of bootstrap replicates
+    :param bool median: True bootstraps the median instead of the mean
+    :param seed: Seed of the resampling, an int, a sequence of ints or None for fresh entropy
+    :param int n_jobs: Worker processes, -1 for every core
+    :param int block: Replicates per task
+    :return: obj : Array of shape (n_boot, n_groups), NaN for empty groups
+    """
+    values = np.asarray(values, dtype=np.float64)
+    keep = ~np.isnan(values)
+    order, starts, counts = group_rows(np.asarray(keys)[keep], n_groups)
+    values = values[keep][order]
+    seeds = np.random.SeedSequence(seed).spawn(-(-n_boot // block))
+    tasks = [(min(block, n_boot - n * block), child, median) for n, child in enumerate(seeds)]
+    if n_jobs is not None and n_jobs < 0:
+        n_jobs = os.cpu_count() or 1
+    if n_jobs is None or n_jobs <= 1 or len(tasks) == 1:
+        blocks = [_replicate_block(task, values, starts, counts) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_worker,
+                                 initargs=(values, starts, counts)) as pool:
+            blocks = list(pool.map(_worker_block, tasks))
+    if not blocks:
+        return np.empty((0, n_groups))
+    return np.concatenate(blocks)
+
+
+def percentile_interval(replicates, ci=0.95):
+    """
+    Percentile confidence interval of bootstrap replicates.
+
+    :param obj replicates: Array of shape (n_boot, ...)
+    :param float ci: Confidence level
+    :return: tuple : (low, high) arrays
+    """
+    alpha = (1 - ci) / 2
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)  # Facets missing from a system give all NaN columns
+        low, high = np.nanquantile(np.asarray(replicates), [alpha, 1 - alpha], axis=0)
+    return low, high
+
+
+def zero_intercept_slope(x, y):
+    """
+    Least squares gradient of y = m x through the origin along the last axis, ignoring pairs with a NaN.
+    This is the gradient of the CAB plot fit.
+
+    :param obj x: Adhesion energies, shape (..., n)
+    :param obj y: Cohesion energies, same shape
+    :return: obj : Gradient of every row
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    both = ~(np.isnan(x) | np.isnan(y))
+    x = np.where(both, x, 0)
+    y = np.where(both, y, 0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return (x * y).sum(axis=-1) / (x * x).sum(axis=-1)
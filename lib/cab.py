@@ -0,0 +1,126 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from lib.bootstrap import zero_intercept_slope
+
+CAB_COLUMNS = ['Probe', 'Excipient', 'Weighted', 'Probes', 'Adhesion', 'Adhesion STD', 'Cohesion', 'Cohesion STD',
+               'CAB Ratio']
+
+
+def _labelled(systems, labels):
+    """Returns {label: SSIMAnalyse} from a dict, or from a list with optional labels (default the data_path)."""
+    if isinstance(systems, dict):
+        return dict(systems)
+    systems = list(systems)
+    if labels is None:
+        labels = [system.data_path for system in systems]
+    if len(labels) != len(systems):
+        raise ValueError("Got {} labels for {} systems".format(len(labels), len(systems)))
+    return dict(zip(labels, systems))
+
+
+def _map(function, items, n_jobs):
+    if n_jobs is None or n_jobs <= 1:
+        return [function(item) for item in items]
+    with ThreadPoolExecutor(max_workers=n_jobs) as pool:
+        return list(pool.map(function, items))
+
+
+def cab_matrix(probes, excipients, probe_labels=None, excipient_labels=None, weighted=False, exp_probe=False,
+               median=False, n_jobs=1, bootstrap=0, ci=0.95, seed=None):
+    """
+    Adhesion, cohesion and CAB ratio of every probe facet for every probe x excipient pair.
+
+    The side statistics of each object are computed once, up front, and then every pair is a lookup in the objects'
+    caches, so the pairs run cheaply across threads.
+
+    :param probes: List or {label: SSIMAnalyse} dict of the probe (API) systems
+    :param excipients: List or {label: SSIMAnalyse} dict of the excipient systems
+    :param list probe_labels: Labels of a list of probes. Defaults to their data_path.
+    :param list excipient_labels: Labels of a list of excipients. Defaults to their data_path.
+    :param bool weighted: True uses the weighted total energy
+    :param bool exp_probe: True takes the right facet of the excipient pairs, see cab_extraction
+    :param bool median: True uses the median instead of the mean
+    :param int n_jobs: Threads used for the statistics and the pairs
+    :param int bootstrap: Number of bootstrap replicates for confidence intervals, see cab_extraction
+    :param float ci: Confidence level of the intervals
+    :param int seed: Seed shared by every pair, so each object is resampled once
+    :return: obj : Tidy dataframe with a row per probe, excipient and probe facet. With bootstrap the gradient CI of
+                   every pair is kept in attrs['Gradient CI'] as {(probe, excipient): (low, high)}.
+    """
+    probes = _labelled(probes, probe_labels)
+    excipients = _labelled(excipients, excipient_labels)
+    energy = 'Weighted Total Energy' if weighted else 'Total Energy'
+    side = 'right' if exp_probe else 'left'
+    # Without a seed every object keeps its one unseeded draw, so repeated calls reuse it
+    entropy = None if seed is None else np.random.SeedSequence(seed).entropy
+
+    # Warm each object's cache once. The seeds match the ones cab_extraction derives from entropy.
+    adhesion_seed, cohesion_seed = (None, None) if entropy is None else ([entropy, 0], [entropy, 1])
+    work = {(id(obj), 'either'): (obj, 'either', cohesion_seed) for obj in probes.values()}
+    work.update({(id(obj), side): (obj, side, adhesion_seed) for obj in excipients.values()})
+
+    def warm(item):
+        obj, obj_side, obj_seed = item
+        obj.side_statistics(energy, obj_side, median=median)
+        if bootstrap:
+            obj.side_bootstrap(energy, obj_side, bootstrap, median=median, seed=obj_seed)
+
+    _map(warm, list(work.values()), n_jobs)
+
+    def pair(names):
+        probe, excipient = names
+        return probes[probe].cab_extraction(excipients[excipient], weighted=weighted, exp_probe=exp_probe,
+                                            median=median, bootstrap=bootstrap, ci=ci, seed=entropy)
+
+    names = [(probe, excipient) for probe in probes for excipient in excipients]
+    frames = []
+    gradient_ci = {}
+    for (probe, excipient), cab in zip(names, _map(pair, names, n_jobs)):
+        cab.insert(0, 'Weighted', weighted)
+        cab.insert(0, 'Excipient', excipient)
+        cab.insert(0, 'Probe', probe)
+        cab.insert(8, 'CAB Ratio', cab['Cohesion'] / cab['Adhesion'])
+        if 'Gradient CI' in cab.attrs:
+            gradient_ci[(probe, excipient)] = cab.attrs['Gradient CI']
+        cab.attrs = {}
+        frames.append(cab)
+    if not frames:
+        return pd.DataFrame(columns=CAB_COLUMNS)
+    table = pd.concat(frames, ignore_index=True)
+    if bootstrap:
+        table.attrs['Gradient CI'] = gradient_ci
+        table.attrs['CI'] = ci
+    return table
+
+
+def rank_excipients(matrix, ascending=True):
+    """
+    Ranks the excipients of every probe by the CAB gradient, the zero-intercept fit of cohesion against adhesion.
+    A gradient below 1 means the probe adheres to the excipient more strongly than it coheres to itself.
+
+    :param obj matrix: Table from cab_matrix
+    :param bool ascending: True ranks the most adhesive excipient (lowest gradient) first
+    :return: obj : Dataframe with Probe, Weighted, Rank, Excipient, Gradient, the number of facets fitted and, after a
+                   bootstrap, the gradient CI
+    """
+    rows = []
+    gradient_ci = matrix.attrs.get('Gradient CI', {})
+    for (probe, excipient, weighted), group in matrix.groupby(['Probe', 'Excipient', 'Weighted'], sort=False):
+        fitted = group['Adhesion'].notnull() & group['Cohesion'].notnull()
+        row = {'Probe': probe, 'Weighted': weighted, 'Excipient': excipient,
+               'Gradient': float(zero_intercept_slope(group['Adhesion'], group['Cohesion'])),
+               'Facets': int(fitted.sum())}
+        if (probe, excipient) in gradient_ci:
+            row['Gradient CI Low'], row['Gradient CI High'] = gradient_ci[(probe, excipient)]
+        rows.append(row)
+    ranking = pd.DataFrame(rows)
+    if ranking.empty:
+        return pd.DataFrame(columns=['Probe', 'Weighted', 'Rank', 'Excipient', 'Gradient', 'Facets'])
+    order = {probe: n for n, probe in enumerate(dict.fromkeys(matrix['Probe']))}
+    ranking = ranking.sort_values(['Probe', 'Weighted', 'Gradient'], ascending=[True, True, ascending], kind='stable',
+                                  ignore_index=True, key=lambda col: col.map(order) if col.name == 'Probe' else col)
+    ranking.insert(2, 'Rank', ranking.groupby(['Probe', 'Weighted'], sort=False).cumcount() + 1)
+    return ranking
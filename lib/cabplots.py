@@ -3,16 +3,19 @@ import matplotlib.pyplot as plt
 from sklearn.linear_model import LinearRegression
 
 
-def drawcabplots(df_data, title=None, label='APIvExp', xlim=(0, -10), ylim=(0, -10)):
+def drawcabplots(df_data, title=None, label='APIvExp', xlim=(0, -10), ylim=(0, -10), show=True):
     """
     Method plots the CAB plots from the statistical table passed. Function also generates a balance cohesive/adhesive line
     using the linear regression model. This is plotted as black on the graph.
 
-    :param (obj)    df_data     : Takes Dataframe containing the statistical descriptors which are used for plotting
+    :param (obj)    df_data     : Takes Dataframe containing the statistical descriptors which are used for plotting.
+                                  Bootstrap CI columns and the 'Gradient CI' attr of cab_extraction are drawn as
+                                  error bars and a band around the fit.
     :param (str)    title       : Passes the name of the title
     :param (str)    label       : Passes the labels for the excipients
     :param (floats) xlim        : Passes a list of two floats to set the x axis
     :param (floats) ylim        : Passes a list of two floats to set the y axis
+    :param (bool)   show        : False - returns the figure without showing it, for saving on a headless backend
     :return: Graph and of CAB Plot
     """
     x1 = np.asarray(df_data['Adhesion']).reshape(-1, 1)
@@ -23,11 +26,25 @@ def drawcabplots(df_data, title=None, label='APIvExp', xlim=(0, -10), ylim=(0, -
 
     x_test = np.linspace(-100, 0)
     y_pred1 = lm1.predict(x_test[:, None])
-    plt.figure(figsize=(8, 6))
+    fig = plt.figure(figsize=(8, 6))
 
     plt.scatter(df_data['Adhesion'], df_data['Cohesion'], s=100, label=label, color='b')
     print("Gradient : " + str(lm1.coef_))
     print("R^2 : " + str(lm1.score(x1, y1)))
+    if 'Adhesion CI Low' in df_data:
+        # Bootstrap confidence intervals of each facet and of the gradient, see cab_extraction
+        xerr = np.abs(np.vstack([df_data['Adhesion'] - df_data['Adhesion CI Low'],
+                                 df_data['Adhesion CI High'] - df_data['Adhesion']]))
+        yerr = np.abs(np.vstack([df_data['Cohesion'] - df_data['Cohesion CI Low'],
+                                 df_data['Cohesion CI High'] - df_data['Cohesion']]))
+        plt.errorbar(df_data['Adhesion'], df_data['Cohesion'], xerr=xerr, yerr=yerr, fmt='none', ecolor='b',
+                     alpha=0.5, capsize=3)
+    if 'Gradient CI' in df_data.attrs:
+        low, high = df_data.attrs['Gradient CI']
+        level = df_data.attrs.get('CI', 0.95)
+        print("Gradient {:.0%} CI : [{}, {}]".format(level, low, high))
+        plt.fill_between(x_test, low * x_test, high * x_test, color='blue', alpha=0.15,
+                         label=label + '-Fit {:.0%} CI'.format(level))
 
     plt.xlabel(r'$Adhesion Energy (mJ/m^2)$', fontsize=12)
     plt.ylabel(r'$Cohesion Energy (mJ/m^2)$', fontsize=12)
@@ -40,4 +57,6 @@ def drawcabplots(df_data, title=None, label='APIvExp', xlim=(0, -10), ylim=(0, -
     plt.plot(x_test, 1 * x_test, 'black', linewidth=2)
     plt.legend(loc='upper left', fontsize=12)
     plt.title(title)
-    plt.show()
+    if show:
+        plt.show()
+    return fig
@@ -0,0 +1,191 @@
+import hashlib
+import json
+import os
+from glob import glob
+
+import numpy as np
+import pandas as pd
+
+from lib import ingest
+
+MANIFEST = 'manifest.json'
+CACHE_VERSION = 2
+# Columns saved to disk, plus the Facet codes. The weighted columns are rebuilt from the morphology.
+CACHED_COLUMNS = ingest.COORD_COLUMNS + list(ingest.ENERGY_COLUMNS.values())
+FACET_CODES = 'facet'
+
+
+def file_signature(path):
+    """Returns the size and modification time (ns) used to decide whether a file has changed."""
+    st = os.stat(path)
+    return st.st_size, st.st_mtime_ns
+
+
+def file_hash(path):
+    """Returns the sha256 of the file content."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class AnalysisCache:
+    """On-disk cache of the normalised interaction table of one SSIMAnalyse.
+
+    The cache directory holds one .npy file per column and one of the Facet codes, with the files of each facet pair
+    adjacent, and a manifest recording the path, size, mtime, facet, area and row count of every source file, the facet
+    categories and the hashes of the morphology files. On the next load only new or changed files are parsed and files
+    that disappeared are dropped. An unchanged cache can also be opened as a table of memory-mapped columns
+    (load_table), which the OS page cache shares between every process mapping it.
+
+    Attributes
+    ----------
+    hits : int
+        Number of files served from the cache on the last read.
+
+    misses : int
+        Number of files that had to be parsed on the last read.
+
+    changed : bool
+        True if the last read differs from what is on disk and the cache needs saving.
+    """
+
+    def __init__(self, cache_dir, dtype='float32'):
+        """
+        :param str cache_dir: Directory holding the cache. Created on the first save.
+        :param str dtype: Float type of the energies. A cache written with another type is discarded.
+        """
+        self.cache_dir = cache_dir
+        self.dtype = np.dtype(dtype).name
+        self.hits = 0
+        self.misses = 0
+        self.changed = False
+        self._signatures = {}
+
+    def _manifest(self):
+        """Reads the manifest, returning None if there is no usable cache."""
+        try:
+            with open(os.path.join(self.cache_dir, MANIFEST)) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if manifest.get('version') != CACHE_VERSION or manifest.get('dtype') != self.dtype:
+            return None
+        return manifest
+
+    def read(self, names, n_jobs=1, executor=None, morph_files=()):
+        """
+        Returns the parsed files like ingest.read_ssim_files, taking unchanged files from the cache.
+
+        :param list names: Paths of the data files
+        :param int n_jobs: Number of worker processes used for the files that need parsing
+        :param obj executor: Optional concurrent.futures executor used for the files that need parsing
+        :param list morph_files: Morphology files in use. The cache is re-saved when their hashes change.
+        :return: tuple : (parsed, failed) in sorted filename order
+        """
+        names = sorted(names)
+        self._signatures = {n: file_signature(n) for n in names}
+        manifest = self._manifest()
+        cached = {}
+        arrays = {}
+        if manifest is not None:
+            offset = 0
+            for entry in manifest['files']:
+                cached[entry['path']] = (entry, offset)
+                offset += entry['rows']
+            for entry in manifest['failed']:
+                cached[entry['path']] = (entry, None)
+            for n, col in enumerate(CACHED_COLUMNS):
+                arrays[col] = np.load(os.path.join(self.cache_dir, '{}_{}.npy'.format(manifest['generation'], n)),
+                                      mmap_mode='r')
+
+        results = {}
+        to_parse = []
+        for name in names:
+            entry, offset = cached.get(os.path.abspath(name), (None, None))
+            if entry is None or (entry['size'], entry['mtime_ns']) != self._signatures[name]:
+                to_parse.append(name)
+            elif offset is None:
+                results[name] = None
+            else:
+                columns = {col: arrays[col][offset:offset + entry['rows']] for col in CACHED_COLUMNS}
+                results[name] = (name, entry['facet'], entry['area'], columns)
+        self.hits = len(names) - len(to_parse)
+        self.misses = len(to_parse)
+
+        parsed, failed = ingest.read_ssim_files(to_parse, n_jobs=n_jobs, executor=executor, dtype=self.dtype)
+        results.update((p[0], p) for p in parsed)
+        results.update((n, None) for n in failed)
+        morphology = [{'path': os.path.abspath(m), 'sha256': file_hash(m)} for m in morph_files]
+        self.changed = manifest is None or bool(to_parse) or len(cached) != len(names) or \
+            manifest['morphology'] != morphology
+        parsed = [results[n] for n in names if results[n] is not None]
+        failed = [n for n in names if results[n] is None]
+        return parsed, failed
+
+    def save(self, parsed, failed, table, morph_files=()):
+        """
+        Writes the table and manifest. Column files are written under a new generation so arrays still mapped from
+        the previous generation are never overwritten.
+
+        :param list parsed: Parsed files in the order their rows appear in the table
+        :param list failed: Files whose names could not be parsed
+        :param obj table: Table built from parsed by ingest.build_table
+        :param list morph_files: Morphology files the weights were taken from
+        """
+        os.makedirs(self.cache_dir, exist_ok=True)
+        old = self._manifest()
+        generation = old['generation'] + 1 if old is not None else 0
+        for n, col in enumerate(CACHED_COLUMNS):
+            np.save(os.path.join(self.cache_dir, '{}_{}.npy'.format(generation, n)), np.ascontiguousarray(table[col]))
+        np.save(os.path.join(self.cache_dir, '{}_{}.npy'.format(generation, FACET_CODES)),
+                np.ascontiguousarray(table['Facet'].cat.codes))
+
+        def describe(name):
+            size, mtime_ns = self._signatures.get(name) or file_signature(name)
+            return {'path': os.path.abspath(name), 'size': size, 'mtime_ns': mtime_ns}
+
+        files = []
+        for name, facet, area, columns in parsed:
+            entry = describe(name)
+            entry.update(facet=facet, area=area, rows=len(columns[CACHED_COLUMNS[0]]))
+            files.append(entry)
+        manifest = {'version': CACHE_VERSION,
+                    'dtype': self.dtype,
+                    'generation': generation,
+                    'files': files,
+                    'failed': [describe(n) for n in failed],
+                    'categories': list(table['Facet'].cat.categories),
+                    'morphology': [{'path': os.path.abspath(m), 'sha256': file_hash(m)} for m in morph_files]}
+        tmp = os.path.join(self.cache_dir, MANIFEST + '.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(manifest, f)
+        os.replace(tmp, os.path.join(self.cache_dir, MANIFEST))
+        self.changed = False
+
+        for path in glob(os.path.join(self.cache_dir, '*.npy')):
+            if not os.path.basename(path).startswith('{}_'.format(generation)):
+                try:
+                    os.remove(path)
+                except OSError:  # Still mapped on some platforms, removed on a later save
+                    pass
+
+    def load_table(self):
+        """
+        Opens the saved table with every column memory-mapped read-only, so nothing is read until it is used and
+        slicing one facet pair only touches its pages. Call after read() with changed False, or after save().
+
+        :return: obj : 'dataframe' laid out like ingest.build_table, or None if there is no usable cache
+        """
+        manifest = self._manifest()
+        if manifest is None:
+            return None
+
+        def load(n):
+            path = os.path.join(self.cache_dir, '{}_{}.npy'.format(manifest['generation'], n))
+            return np.load(path, mmap_mode='r').view(np.ndarray)  # Still backed by the map, without the subclass
+
+        table = {'Facet': pd.Categorical.from_codes(load(FACET_CODES), categories=manifest['categories'])}
+        table.update((col, load(n)) for n, col in enumerate(CACHED_COLUMNS))
+        return pd.DataFrame(table, copy=False)
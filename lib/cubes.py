@@ -0,0 +1,67 @@
+import numpy as np
+
+
+class EnergyCube:
+    """Dense energy surface of one facet pair and energy component on the rotation x Y x X grid.
+
+    Attributes
+    ----------
+    values : obj : 'ndarray'
+        Energies of shape (len(rotations), len(y), len(x)). Grid points without a pose are NaN.
+
+    rotations, y, x : obj : 'ndarray'
+        Sorted coordinates of each axis.
+    """
+
+    def __init__(self, values, rotations, y, x):
+        self.values = values
+        self.rotations = rotations
+        self.y = y
+        self.x = x
+
+    @property
+    def nbytes(self):
+        return self.values.nbytes + self.rotations.nbytes + self.y.nbytes + self.x.nbytes
+
+    def frame(self, rotation):
+        """Returns the Y x X slice at the given rotation, or an all NaN slice if the rotation was not sampled."""
+        n = np.searchsorted(self.rotations, rotation)
+        if n < len(self.rotations) and self.rotations[n] == rotation:
+            return self.values[n]
+        return np.full(self.values.shape[1:], np.nan, dtype=self.values.dtype)
+
+    def extent(self):
+        """Returns the (left, right, bottom, top) extent of a frame for imshow, with cells centred on the grid."""
+        def edges(axis):
+            if len(axis) < 2:
+                return float(axis[0]) - 0.5, float(axis[-1]) + 0.5
+            step = (axis[-1] - axis[0]) / (len(axis) - 1)
+            return float(axis[0]) - step / 2, float(axis[-1]) + step / 2
+        return edges(self.x) + edges(self.y)
+
+
+def build_cube(x, y, rotation, values):
+    """
+    Scatters the poses of one facet pair onto a dense rotation x Y x X grid. A pose sampled more than once, e.g. by two
+    files of the same facet pair with overlapping grids, keeps its lowest energy.
+
+    >>> build_cube([0, 1, 0], [0, 0, 0], [0, 0, 0], [-1.0, -2.0, -3.0]).values
+    array([[[-3., -2.]]])
+
+    :param obj x: X axis displacement of every pose
+    :param obj y: Y axis displacement of every pose
+    :param obj rotation: Rotation of every pose
+    :param obj values: Energy of every pose
+    :return: obj : EnergyCube
+    """
+    rotations, r_idx = np.unique(np.asarray(rotation), return_inverse=True)
+    ys, y_idx = np.unique(np.asarray(y), return_inverse=True)
+    xs, x_idx = np.unique(np.asarray(x), return_inverse=True)
+    values = np.asarray(values)
+    cube = np.full((len(rotations), len(ys), len(xs)), np.nan, dtype=values.dtype)
+    flat = np.ravel_multi_index((r_idx.ravel(), y_idx.ravel(), x_idx.ravel()), cube.shape)
+    if len(flat) and np.bincount(flat, minlength=cube.size).max() > 1:
+        np.fmin.at(cube.reshape(-1), flat, values)  # Unbuffered, so every duplicate is compared; NaN never wins
+    else:
+        cube.reshape(-1)[flat] = values
+    return EnergyCube(cube, rotations, ys, xs)
@@ -0,0 +1,108 @@
+import numpy as np
+
+
+def _linear_binning(values, low, delta, gridsize):
+    """Splits every value between its two neighbouring grid points in proportion to its distance from each."""
+    position = (values - low) / delta
+    left = np.floor(position).astype(np.intp)
+    frac = position - left
+    counts = np.bincount(np.clip(left, 0, gridsize - 1), weights=1 - frac, minlength=gridsize)
+    counts += np.bincount(np.clip(left + 1, 0, gridsize - 1), weights=frac, minlength=gridsize)
+    return counts[:gridsize]
+
+
+# Rules of thumb of scipy's gaussian_kde, which seaborn used, as functions of the number of values
+BW_METHODS = {'scott': lambda n: n ** (-1 / 5),
+              'silverman': lambda n: (n * 3 / 4) ** (-1 / 5)}
+
+
+def bandwidth_factor(bw, n):
+    """
+    Returns the bandwidth factor of a scalar bw or of the 'scott' and 'silverman' rules for n values.
+
+    >>> bandwidth_factor(0.2, 1000)
+    0.2
+    >>> round(bandwidth_factor('scott', 100000), 4)
+    0.1
+    """
+    if isinstance(bw, str):
+        if bw not in BW_METHODS:
+            raise ValueError("bw must be a number, 'scott' or 'silverman', got '{}'".format(bw))
+        return BW_METHODS[bw](max(n, 1))
+    return bw
+
+
+def binned_kde(values, bw=0.2, gridsize=512, cut=3, grid=None):
+    """
+    Gaussian kernel density estimate computed by binning the data on a regular grid and convolving with the kernel
+    through an FFT, so the cost is O(n + gridsize log gridsize) instead of O(n x gridsize).
+
+    :param obj values: Array of values. NaN is ignored.
+    :param float bw: Bandwidth factor. The kernel standard deviation is bw times the standard deviation of the data,
+                     as with the bw of the seaborn KDE and violin plots. 'scott' or 'silverman' picks the factor
+                     from the number of values.
+    :param int gridsize: Number of grid points when no grid is given
+    :param float cut: Number of bandwidths the grid extends past the extreme values
+    :param obj grid: Optional regular grid to evaluate on
+    :return: tuple : (grid, density)
+    """
+    values = np.asarray(values, dtype=np.float64)
+    values = values[np.isfinite(values)]
+    if len(values) == 0:
+        grid = np.zeros(1) if grid is None else grid
+        return grid, np.zeros(len(grid))
+    std = values.std(ddof=1) if len(values) > 1 else 0.0
+    bandwidth = bandwidth_factor(bw, len(values)) * std if std > 0 else max(abs(values[0]) * 1e-3, 1e-3)
+    if grid is None:
+        grid = np.linspace(values.min() - cut * bandwidth, values.max() + cut * bandwidth, gridsize)
+    gridsize = len(grid)
+    delta = (grid[-1] - grid[0]) / (gridsize - 1) if gridsize > 1 else 1.0
+    counts = _linear_binning(values, grid[0], delta, gridsize)
+
+    # Kernel sampled on the grid spacing out to 4 bandwidths, convolved with zero padding so nothing wraps round
+    half = int(min(gridsize - 1, np.ceil(4 * bandwidth / delta)))
+    offsets = np.arange(-half, half + 1) * delta
+    kernel = np.exp(-0.5 * (offsets / bandwidth) ** 2) / (bandwidth * np.sqrt(2 * np.pi))
+    size = gridsize + len(kernel) - 1
+    nfft = 1 << int(np.ceil(np.log2(size)))
+    conv = np.fft.irfft(np.fft.rfft(counts, nfft) * np.fft.rfft(kernel, nfft), nfft)
+    density = conv[half:half + gridsize] / len(values)
+    return grid, np.clip(density, 0, None)
+
+
+class DensityCache:
+    """Binned KDEs of one dataset, cached per (energy, facet, bandwidth, gridsize).
+
+    Changing which facets are shown only looks densities up, nothing is re-estimated.
+    """
+
+    def __init__(self, get_values, instrument=None):
+        """
+        :param obj get_values: Callable taking (energy, facet) and returning the values, facet None meaning all rows
+        :param obj instrument: Optional Instrument counting the lookups as 'densities' hits and misses
+        """
+        self.get_values = get_values
+        self.instrument = instrument
+        self._densities = {}
+
+    def __call__(self, energy, facet=None, bw=0.2, gridsize=512):
+        """Returns (grid, density) of an energy over one facet pair, or over every pair if facet is None."""
+        key = (energy, facet, bw, gridsize)
+        density = self._densities.get(key)
+        if self.instrument is not None:
+            self.instrument.count('densities', density is not None)
+        if density is None:
+            density = binned_kde(self.get_values(energy, facet), bw=bw, gridsize=gridsize)
+            self._densities[key] = density
+        return density
+
+    def clear(self, energies=None, facets=None):
+        """Drops every density, or only those of the given energies and/or facet pairs (None meaning every row)."""
+        if energies is None and facets is None:
+            self._densities.clear()
+        else:
+            energies = None if energies is None else set(energies)
+            facets = None if facets is None else set(facets)
+            self._densities = {key: d for key, d in self._densities.items()
+                               if not ((energies is None or key[0] in energies) and
+                                       (facets is None or key[1] in facets))}
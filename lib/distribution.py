@@ -27,18 +27,19 @@ def plot(sets, labels, weighted=False, xlimit=(-10,0), kbw=0.2, tables=False, en
     x = 0
     sns.set(style="whitegrid", palette="pastel", color_codes=True)
     a4_dims = (8, 8)
-    plt.subplots(figsize=a4_dims)
+    fig, ax = plt.subplots(figsize=a4_dims)
     full = sns.set(context='paper', font_scale=2.1)
     for x, data in enumerate(sets):
         exp = labels[x]
-        if weighted:
-            full = sns.kdeplot(data.weighted_data[energy], shade=True, bw=kbw, label=exp).set(xlim=xlimit)
-            ttable = data.weighted_data[energy].describe()
-            table[exp] = ttable
+        if data.data_all is None:  # Streaming objects only hold statistics, so there is nothing to estimate a KDE from
+            print("{} was analysed in streaming mode, only its statistics are tabled".format(exp))
         else:
-            full = sns.kdeplot(data.violin_data[energy], shade=True, bw=kbw, label=exp).set(xlim=xlimit)
-            ttable = data.violin_data[energy].describe()
-            table[exp] = ttable
+            # Binned FFT KDE cached on the object, so replotting does not re-estimate
+            grid, density = data.density(energy, bw=kbw)
+            line, = ax.plot(grid, density, label=exp)
+            ax.fill_between(grid, density, color=line.get_color(), alpha=0.25)
+        table[exp] = data.describe(energy)
+    ax.set(xlim=xlimit)
     plt.legend(prop={'size': 16}, title='Surfaces')
     plt.title('Density Plot with Multiple Surfaces (' + energy + ')')
     plt.ylabel('Density', fontsize=12)
@@ -0,0 +1,228 @@
+"""Headless batch export of the SSIM plots.
+
+Figures are rendered with the non-interactive Agg backend, optionally across worker processes, and written under
+save_path:
+
+    heatmaps/<energy>/<facet>/rotation_<r>.<fmt>   one file per rotation frame
+    heatmaps/<energy>/<facet>.<gif|mp4>            rotation animation
+    violins/<energy>_<n>.<fmt>                     violin panels of up to facets_per_panel facet pairs
+    cabplots/<label>.<fmt>                         CAB plot against each excipient
+
+Outputs newer than every data and morphology file are skipped unless force is set.
+
+Command line use:
+    python -m lib.export --morph "C:\\Data\\**\\*LGA_Morphology*.csv" --data "C:\\Data\\**\\*LGA*_*.csv" --save out
+"""
+import argparse
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from glob import glob
+
+import numpy as np
+import pandas as pd
+
+KINDS = ('heatmaps', 'violins', 'cabplots')
+
+
+def _init_worker():
+    """Switches the worker to the non-interactive backend before any figure is made."""
+    import matplotlib
+    matplotlib.use('Agg', force=True)
+
+
+def _safe(label):
+    return str(label).replace('/', '_').replace(' ', '_')
+
+
+def _up_to_date(outputs, source_mtime):
+    """True if every output exists and is newer than the newest source file."""
+    for path in outputs:
+        if not os.path.exists(path) or os.path.getmtime(path) < source_mtime:
+            return False
+    return True
+
+
+def _render_heatmaps(task):
+    """Worker: renders every rotation frame of one facet pair and energy component, then the animation."""
+    import matplotlib.pyplot as plt
+    from matplotlib import animation as _animation
+    from lib.cubes import EnergyCube
+    from lib.heatmaps import HeatmapView
+
+    cube = EnergyCube(*task['cube'])
+    view = HeatmapView(lambda facet, energy: cube, max_cells=None)
+    for rotation, outputs in zip(cube.rotations, task['frames']):
+        view.show(task['facet'], task['energy'], rotation)
+        for path in outputs:
+            view.fig.savefig(path)
+    if task['animation'] is not None:
+        writer = 'pillow' if task['animation'].endswith('.gif') else 'ffmpeg'
+        anim = _animation.FuncAnimation(view.fig, lambda n: view.show(task['facet'], task['energy'],
+                                                                       cube.rotations[n]),
+                                        frames=len(cube.rotations), interval=525)
+        anim.save(task['animation'], writer=writer)
+    plt.close(view.fig)
+    return task['name']
+
+
+def _render_violins(task):
+    """Worker: renders one violin panel."""
+    import matplotlib.pyplot as plt
+    from lib import violinplots
+
+    data = pd.DataFrame({'Facet': pd.Categorical.from_codes(task['codes'], categories=task['categories']),
+                         task['energy']: task['values']})
+    violinplots.draw_violin(data, task['energy'], task['energy'], task['facets'], ylimit=task['ylimit'],
+                            title=task['title'], bw=task['bw'], inner=None, orient='v')
+    fig = plt.gcf()
+    for path in task['outputs']:
+        fig.savefig(path, bbox_inches='tight')
+    plt.close(fig)
+    return task['name']
+
+
+def _render_cabplot(task):
+    """Worker: renders the CAB plot of one probe/excipient table."""
+    import matplotlib.pyplot as plt
+    from lib import cabplots
+
+    fig = cabplots.drawcabplots(task['table'], title=task['title'], label=task['label'], xlim=task['xlim'],
+                                ylim=task['ylim'], show=False)
+    for path in task['outputs']:
+        fig.savefig(path, bbox_inches='tight')
+    plt.close(fig)
+    return task['name']
+
+
+def source_mtime(analysis):
+    """Returns the newest modification time of the data and morphology files behind an SSIMAnalyse."""
+    files = glob(analysis.data_path, recursive=True)
+    if analysis.morphology is not None:
+        files += list(analysis.morphology.files)
+    return max([os.path.getmtime(f) for f in files] or [0])
+
+
+def _tasks(analysis, save_path, kinds, formats, animation, energies, facets, excipients, facets_per_panel,
+           ylimit, bw, xlim, ylim, stamp, force):
+    """Yields (render function, task) for every output that is missing or out of date."""
+    energies = list(analysis.get_col_options(weighted=False)) if energies is None else list(energies)
+    facets = list(analysis.whole_list) if facets is None else list(facets)
+
+    if 'heatmaps' in kinds:
+        for energy in energies:
+            for facet in facets:
+                cube = analysis.energy_cube(facet, energy)
+                folder = os.path.join(save_path, 'heatmaps', _safe(energy), _safe(facet))
+                frames = [[os.path.join(folder, 'rotation_{}.{}'.format(r, fmt)) for fmt in formats]
+                          for r in cube.rotations]
+                anim = folder + '.' + animation if animation else None
+                outputs = [p for frame in frames for p in frame] + ([anim] if anim else [])
+                if not force and _up_to_date(outputs, stamp):
+                    continue
+                os.makedirs(folder, exist_ok=True)
+                yield _render_heatmaps, {'name': '{} {}'.format(energy, facet), 'facet': facet, 'energy': energy,
+                                         'cube': (cube.values, cube.rotations, cube.y, cube.x),
+                                         'frames': frames, 'animation': anim}
+
+    if 'violins' in kinds:
+        folder = os.path.join(save_path, 'violins')
+        ordered = [f for f in analysis.get_facet_list() if f in set(facets)]
+        codes = analysis.data_all['Facet'].cat.codes.to_numpy()
+        categories = list(analysis.data_all['Facet'].cat.categories)
+        for energy in energies:
+            for n in range(0, len(ordered), facets_per_panel):
+                panel = ordered[n:n + facets_per_panel]
+                name = '{}_{}'.format(_safe(energy), n // facets_per_panel)
+                outputs = [os.path.join(folder, '{}.{}'.format(name, fmt)) for fmt in formats]
+                if not force and _up_to_date(outputs, stamp):
+                    continue
+                os.makedirs(folder, exist_ok=True)
+                keep = np.isin(codes, [categories.index(f) for f in panel])
+                yield _render_violins, {'name': name, 'energy': energy, 'facets': panel, 'codes': codes[keep],
+                                        'categories': categories,
+                                        'values': analysis.energy_values(energy)[keep],
+                                        'ylimit': ylimit, 'title': energy, 'bw': bw, 'outputs': outputs}
+
+    if 'cabplots' in kinds and excipients:
+        folder = os.path.join(save_path, 'cabplots')
+        for label, excipient in excipients.items():
+            outputs = [os.path.join(folder, '{}.{}'.format(_safe(label), fmt)) for fmt in formats]
+            if not force and _up_to_date(outputs, max(stamp, source_mtime(excipient))):
+                continue
+            os.makedirs(folder, exist_ok=True)
+            yield _render_cabplot, {'name': label, 'table': analysis.cab_extraction(excipient), 'title': label,
+                                    'label': label, 'xlim': xlim, 'ylim': ylim, 'outputs': outputs}
+
+
+def export(analysis, save_path=None, kinds=KINDS, formats=('png',), animation='gif', energies=None, facets=None,
+           excipients=None, n_jobs=1, force=False, facets_per_panel=10, ylimit=(-40, 0), bw=0.2,
+           xlim=(0, -10), ylim=(0, -10)):
+    """
+    Renders the plots of an SSIMAnalyse to files without a notebook.
+
+    :param obj analysis: SSIMAnalyse object to export
+    :param str save_path: Output folder. Defaults to analysis.save_path.
+    :param list kinds: Any of 'heatmaps', 'violins' and 'cabplots'
+    :param list formats: Image formats for still figures, e.g. ('png', 'svg', 'pdf')
+    :param str animation: 'gif' or 'mp4' for the rotation animation of each heatmap, None to skip it
+    :param list energies: Energy columns to export. Defaults to the unweighted columns.
+    :param list facets: Facet pairs to export. Defaults to whole_list.
+    :param dict excipients: {label: SSIMAnalyse} excipients for the CAB plots, with analysis as the probe
+    :param int n_jobs: Number of worker processes. -1 uses every core.
+    :param bool force: True renders every output even if it is up to date
+    :param int facets_per_panel: Number of facet pairs in each violin panel
+    :return: list : Names of the figures rendered
+    """
+    save_path = save_path if save_path is not None else analysis.save_path
+    if save_path is None:
+        raise ValueError("No save_path given")
+    if n_jobs is not None and n_jobs < 0:
+        n_jobs = os.cpu_count() or 1
+    stamp = source_mtime(analysis)
+    tasks = list(_tasks(analysis, save_path, kinds, formats, animation, energies, facets, excipients or {},
+                        facets_per_panel, ylimit, bw, xlim, ylim, stamp, force))
+    done = []
+    if not n_jobs or n_jobs <= 1:
+        import matplotlib.pyplot as plt
+        with plt.ioff():
+            for render, task in tasks:
+                done.append(render(task))
+                print("Exported {} ({}/{})".format(done[-1], len(done), len(tasks)))
+        return done
+    with ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_worker) as pool:
+        futures = [pool.submit(render, task) for render, task in tasks]
+        for future in as_completed(futures):
+            done.append(future.result())
+            print("Exported {} ({}/{})".format(done[-1], len(done), len(tasks)))
+    return done
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Batch export of SSIM heatmaps, violin plots and CAB plots.")
+    parser.add_argument('--morph', required=True, help="Glob of the morphology file(s)")
+    parser.add_argument('--data', required=True, help="Glob of the SSIM output files")
+    parser.add_argument('--save', required=True, help="Output folder")
+    parser.add_argument('--kinds', nargs='+', default=list(KINDS), choices=KINDS)
+    parser.add_argument('--formats', nargs='+', default=['png'], choices=['png', 'svg', 'pdf'])
+    parser.add_argument('--animation', default='gif', choices=['gif', 'mp4', 'none'])
+    parser.add_argument('--energies', nargs='+', default=None)
+    parser.add_argument('--excipient', nargs=3, action='append', default=[], metavar=('LABEL', 'MORPH', 'DATA'),
+                        help="Excipient for the CAB plots. May be repeated.")
+    parser.add_argument('--n-jobs', type=int, default=1, help="Worker processes, -1 for every core")
+    parser.add_argument('--cache-dir', default=None, help="Analysis cache directory")
+    parser.add_argument('--force', action='store_true', help="Render outputs even if they are up to date")
+    args = parser.parse_args(argv)
+
+    _init_worker()
+    from ssim_tool import SSIMAnalyse
+    analysis = SSIMAnalyse(args.morph, args.data, save_path=args.save, n_jobs=args.n_jobs, cache_dir=args.cache_dir)
+    excipients = {label: SSIMAnalyse(morph, data, n_jobs=args.n_jobs) for label, morph, data in args.excipient}
+    export(analysis, kinds=args.kinds, formats=args.formats,
+           animation=None if args.animation == 'none' else args.animation, energies=args.energies,
+           excipients=excipients, n_jobs=args.n_jobs, force=args.force)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,176 @@
+import numpy as np
+import pandas as pd
+
+
+def group_statistics(values, keys, n_groups, median=False):
+    """
+    Count, mean and sample std (and optionally median) of values grouped by integer keys, in one vectorised pass.
+
+    :param obj values: Array of values
+    :param obj keys: Array of group keys in [0, n_groups)
+    :param int n_groups: Number of groups
+    :param bool median: True also computes the median of each group
+    :return: obj : Dataframe indexed by group key with 'count', 'mean', 'std' (and 'median') columns
+    """
+    values = np.asarray(values, dtype=np.float64)
+    keep = ~np.isnan(values)
+    values = values[keep]
+    keys = np.asarray(keys)[keep]
+    count = np.bincount(keys, minlength=n_groups)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.bincount(keys, weights=values, minlength=n_groups) / count
+        # Second pass about the group mean keeps the variance stable for large energies
+        m2 = np.bincount(keys, weights=(values - mean[keys]) ** 2, minlength=n_groups)
+        std = np.sqrt(m2 / (count - 1))
+    std[count < 2] = np.nan
+    stats = pd.DataFrame({'count': count, 'mean': mean, 'std': std})
+    if median:
+        stats['median'] = pd.Series(values).groupby(keys).median().reindex(stats.index).to_numpy()
+    return stats
+
+
+def combine_statistics(count, mean, m2, keys, n_groups):
+    """
+    Merges per pair count, mean and sum of squared deviations (m2) into statistics of groups of pairs, using the
+    parallel variance formula. Pairs with no rows or a NaN mean are left out.
+
+    :param obj count: Rows of every pair
+    :param obj mean: Mean of every pair
+    :param obj m2: Sum of squared deviations about the mean of every pair
+    :param obj keys: Group key of every pair in [0, n_groups)
+    :param int n_groups: Number of groups
+    :return: obj : Dataframe indexed by group key with 'count', 'mean' and 'std' columns
+    """
+    keep = (count > 0) & ~np.isnan(mean)
+    count, mean, m2, keys = count[keep], mean[keep], m2[keep], np.asarray(keys)[keep]
+    n = np.bincount(keys, weights=count, minlength=n_groups)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        group_mean = np.bincount(keys, weights=count * mean, minlength=n_groups) / n
+        group_m2 = np.bincount(keys, weights=m2 + count * (mean - group_mean[keys]) ** 2, minlength=n_groups)
+        std = np.sqrt(group_m2 / (n - 1))
+    std[n < 2] = np.nan
+    return pd.DataFrame({'count': n.astype(np.int64), 'mean': group_mean, 'std': std})
+
+
+class FacetIndex:
+    """Index of the facet pairs in a table sorted so every pair occupies one contiguous block of rows.
+
+    Facet pairs are the categories of the 'Facet' column ('hkl1/hkl2'). Each side of a pair is mapped to a code in one
+    shared list of facets so rows can be grouped by the left facet, the right facet or either side by exact match.
+
+    Attributes
+    ----------
+    pairs : obj : 'list'
+        Facet pairs in category order.
+
+    facets : obj : 'list'
+        Every facet appearing on either side of a pair, in order of first appearance.
+
+    left, right : obj : 'ndarray'
+        Code in facets of the left and right facet of every pair.
+
+    starts, stops : obj : 'ndarray'
+        Row range of every pair.
+    """
+
+    def __init__(self, facet_column):
+        """
+        :param obj facet_column: Categorical 'Facet' column of the table, with the rows grouped by pair
+        """
+        self.pairs = list(facet_column.cat.categories)
+        self.codes = facet_column.cat.codes.to_numpy()
+        self.facets = []
+        position = {}
+        sides = []
+        for pair in self.pairs:
+            for hkl in pair.split('/'):
+                if hkl not in position:
+                    position[hkl] = len(self.facets)
+                    self.facets.append(hkl)
+                sides.append(position[hkl])
+        self._position = position
+        self._pair_code = {pair: n for n, pair in enumerate(self.pairs)}
+        self.left = np.array(sides[0::2], dtype=np.intp)
+        self.right = np.array(sides[1::2], dtype=np.intp)
+        counts = np.bincount(self.codes, minlength=len(self.pairs))
+        self.stops = np.cumsum(counts)
+        self.starts = self.stops - counts
+        self.contiguous = bool(np.all(np.diff(self.codes) >= 0))
+
+    def rows(self, pair):
+        """Returns the rows of one facet pair, as a slice when the rows are contiguous."""
+        code = self._pair_code[pair]
+        if self.contiguous:
+            return slice(int(self.starts[code]), int(self.stops[code]))
+        return np.flatnonzero(self.codes == code)
+
+    def side_keys(self, side):
+        """
+        Returns (row positions, facet codes) so every row is keyed by the facet on the chosen side of its pair.
+
+        :param str side: 'left', 'right' or 'either'. With 'either' a row is counted once under each distinct facet
+                         of its pair.
+        """
+        rows = np.arange(len(self.codes))
+        if side == 'left':
+            return rows, self.left[self.codes]
+        if side == 'right':
+            return rows, self.right[self.codes]
+        left = self.left[self.codes]
+        right = self.right[self.codes]
+        other = np.flatnonzero(left != right)
+        return np.concatenate([rows, other]), np.concatenate([left, right[other]])
+
+    def side_pairs(self, side):
+        """Returns (pair codes, facet codes) keying every pair by the facet on the chosen side, like side_keys."""
+        pairs = np.arange(len(self.pairs))
+        if side == 'left':
+            return pairs, self.left
+        if side == 'right':
+            return pairs, self.right
+        other = np.flatnonzero(self.left != self.right)
+        return np.concatenate([pairs, other]), np.concatenate([self.left, self.right[other]])
+
+    def side_statistics(self, values, side, median=False, scale=None):
+        """
+        Statistics of values for every facet on the chosen side of the pairs.
+
+        :param obj values: Column of the table
+        :param str side: 'left', 'right' or 'either'
+        :param bool median: True also computes the median
+        :param obj scale: Optional non-negative factor of every pair (e.g. its collision probability) the values are
+                          multiplied by. Without the median the per pair statistics are scaled and merged, so no
+                          scaled copy of the column is made.
+        :return: obj : Dataframe indexed by facet
+        """
+        if scale is not None and not median:
+            pair_stats = group_statistics(values, self.codes, len(self.pairs))
+            count = pair_stats['count'].to_numpy().astype(np.float64)
+            m2 = np.nan_to_num(pair_stats['std'].to_numpy() ** 2 * (count - 1))  # Single row pairs have no spread
+            pairs, keys = self.side_pairs(side)
+            stats = combine_statistics(count[pairs], (pair_stats['mean'].to_numpy() * scale)[pairs],
+                                       (m2 * np.asarray(scale) ** 2)[pairs], keys, len(self.facets))
+        else:
+            if scale is not None:
+                values = np.asarray(values) * np.asarray(scale, dtype=np.asarray(values).dtype)[self.codes]
+            rows, keys = self.side_keys(side)
+            stats = group_statistics(np.asarray(values)[rows], keys, len(self.facets), median=median)
+        stats.index = pd.Index(self.facets, name='Facet')
+        return stats
+
+    def pair_statistics(self, values, median=False, scale=None):
+        """
+        Statistics of values for every facet pair, indexed by pair.
+
+        :param obj values: Column of the table
+        :param bool median: True also computes the median
+        :param obj scale: Optional non-negative factor of every pair the statistics are multiplied by. A pair whose
+                          factor is NaN (missing from the morphology) has no weighted values, so its count is 0.
+        """
+        stats = group_statistics(values, self.codes, len(self.pairs), median=median)
+        if scale is not None:
+            for col in ['mean', 'std'] + (['median'] if median else []):
+                stats[col] = stats[col].to_numpy() * scale
+            stats['count'] = np.where(np.isnan(scale), 0, stats['count'].to_numpy())
+        stats.index = pd.Index(self.pairs, name='Facet')
+        return stats
@@ -1,49 +1,180 @@
-import seaborn as sns
-import pandas as pd
+import warnings
+
+import numpy as np
 import matplotlib.pyplot as plt
 
 
-def drawheatmap(data, energy_comp, facet_list, rot_slide, slider):
+def downsample(frame, factor, method='min'):
+    """
+    Block pools a 2D frame by an integer factor on both axes. Edge blocks are padded with NaN and NaN is ignored.
+
+    :param obj frame: 2D array of energies
+    :param int factor: Number of cells per block side
+    :param str method: 'min' keeps the lowest energy of each block so minima stay visible, 'mean' averages the block
+    :return: obj : Pooled array of shape (ceil(ny / factor), ceil(nx / factor))
     """
-    Draws heatmaps of XYE datasets where is a chosen energy for a chosen set of facets. Also plots a distribution plot
-    :param obj data : Takes the heatmap data from SSIM analysis module
-    :param str energy_comp: Used to select the energy to plot the heat map
-    :param str facet_list:  Used to select the facet combination to plot
-    :param int rot_slide: Used to select the rotation of the facets
-    :param int slider:  Used to select the roation of the facets
-    :return: Returns HeatMap plus distribution plot
+    if factor <= 1:
+        return frame
+    ny, nx = frame.shape
+    padded = np.pad(frame.astype(float, copy=False), ((0, -ny % factor), (0, -nx % factor)),
+                    constant_values=np.nan)
+    blocks = padded.reshape(padded.shape[0] // factor, factor, padded.shape[1] // factor, factor)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)  # All NaN blocks stay NaN
+        if method == 'mean':
+            return np.nanmean(blocks, axis=(1, 3))
+        return np.nanmin(blocks, axis=(1, 3))
+
+
+def _step(axis):
+    return float(axis[-1] - axis[0]) / (len(axis) - 1) if len(axis) > 1 else 1.0
+
+
+class HeatmapView:
+    """Heatmap and energy distribution of one frame of an energy cube, updated in place.
+
+    The figure, image and histogram are created once. Changing the rotation only swaps the image data and the bar
+    heights; changing the facet pair or energy component also resets the axes extent and histogram bins.
+
+    The energy surface is drawn as a raster. When the visible part of a frame has more than max_cells cells it is
+    block pooled (minimum by default) before drawing. Zooming re-renders the visible window from the full resolution
+    cube, so the detail comes back once the window is small enough, and export() always saves at full resolution.
     """
-    sns.set(style="whitegrid", palette="pastel", color_codes=True)
-    sns.set(context='paper')
-    temp_list = []
-    col_names = [energy_comp]
-    for col in col_names:
-        #print("Col Value = " + str(col))
-        df_new = data[[col, 'Facet', 'X axis Displacement', 'Y axis Displacement', 'Rotation']]
-        df_new = df_new.rename(columns={col: 'Interaction Energy(mJ/m^2)'})
-        df_new['Energy Contribution'] = col
-        temp_list.append(df_new)
-    df_data = pd.concat(temp_list)
-    to_matrix = df_data[(df_data['Facet'] == facet_list) & (df_data['Rotation'] == slider)][['X axis Displacement',
-                                                                                             'Y axis Displacement',
-                                                                                             'Interaction Energy(mJ/m^2)',
-                                                                                             'Energy Contribution']]
-    to_hist = to_matrix['Interaction Energy(mJ/m^2)']
-    to_plot = to_matrix.pivot(index='Y axis Displacement',
-                              columns='X axis Displacement',
-                              values='Interaction Energy(mJ/m^2)')
-
-    a4_dims = (16, 8)
-    g, axs = plt.subplots(figsize=a4_dims, ncols=2)
-    sns.set(context='paper', font_scale=2.1)
-    g = sns.heatmap(to_plot, cbar_kws={'label': energy_comp}, cmap="RdBu_r", ax=axs[0])
-    g = sns.distplot(to_hist, color="r", ax=axs[1])
-    axs[0].set_xlabel('X axis Displacement(A)', fontsize=20)
-    axs[0].set_ylabel('Y axis Displacement(A)', fontsize=20)
-    axs[0].tick_params(labelsize=15)
-    axs[1].tick_params(labelsize=15)
-    axs[1].set_xlabel(energy_comp, fontsize=20)
-    axs[1].set_ylabel('Density', fontsize=20)
-    # axs[1].set(xlim(to_hist['Interaction Energy(mJ/m^2)'.min()]))
-    axs[0].invert_yaxis()
-    return g
+
+    def __init__(self, get_cube, figsize=(16, 8), max_cells=40000, pooling='min'):
+        """
+        :param obj get_cube: Callable taking (facet, energy) and returning the EnergyCube to display
+        :param floats figsize: Size of the figure
+        :param int max_cells: Largest number of cells drawn before the frame is downsampled
+        :param str pooling: 'min' or 'mean' block pooling used when downsampling
+        """
+        self.get_cube = get_cube
+        self.max_cells = max_cells
+        self.pooling = pooling
+        self.cube = None
+        self.key = None
+        self.frame = None
+        self.rotation = None
+        self.bins = None
+        self.factor = 1
+        with plt.ioff():
+            self.fig, self.axs = plt.subplots(figsize=figsize, ncols=2)
+        self.image = None
+        self.colorbar = None
+        self.bars = None
+        self._rendering = False
+
+    def _set_cube(self, facet, energy_comp):
+        """Switches the displayed cube and rebuilds the artists that depend on its grid."""
+        self.cube = self.get_cube(facet, energy_comp)
+        self.key = (facet, energy_comp)
+        values = self.cube.values[~np.isnan(self.cube.values)]
+        low, high = (values.min(), values.max()) if len(values) else (0, 1)
+        self.bins = np.linspace(low, high if high > low else low + 1, 41)
+        ax_map, ax_hist = self.axs
+        left, right, bottom, top = self.cube.extent()
+        if self.image is None:
+            self.image = ax_map.imshow(self.cube.values[0], origin='lower', cmap="RdBu_r", aspect='auto',
+                                       interpolation='nearest', extent=self.cube.extent())
+            self.colorbar = self.fig.colorbar(self.image, ax=ax_map)
+            ax_map.set_xlabel('X axis Displacement(A)', fontsize=20)
+            ax_map.set_ylabel('Y axis Displacement(A)', fontsize=20)
+            ax_map.tick_params(labelsize=15)
+            ax_map.set_autoscale_on(False)
+            ax_map.callbacks.connect('xlim_changed', self._on_zoom)
+            ax_map.callbacks.connect('ylim_changed', self._on_zoom)
+        self._rendering = True
+        ax_map.set_xlim(left, right)
+        ax_map.set_ylim(bottom, top)
+        self._rendering = False
+        self.colorbar.set_label(energy_comp, fontsize=15)
+        ax_hist.clear()
+        self.bars = ax_hist.bar(self.bins[:-1], np.zeros(len(self.bins) - 1), width=np.diff(self.bins),
+                                align='edge', color="r", alpha=0.6)
+        ax_hist.set_xlim(self.bins[0], self.bins[-1])
+        ax_hist.set_xlabel(energy_comp, fontsize=20)
+        ax_hist.set_ylabel('Density', fontsize=20)
+        ax_hist.tick_params(labelsize=15)
+        self.axs[0].set_title(facet)
+
+    def _window(self):
+        """Returns the (Y, X) slices of the frame inside the current axes limits."""
+        ax_map = self.axs[0]
+        windows = []
+        for axis, limits in ((self.cube.y, ax_map.get_ylim()), (self.cube.x, ax_map.get_xlim())):
+            half = _step(axis) / 2
+            low, high = sorted(limits)
+            start = int(np.searchsorted(axis, low - half, side='left'))
+            stop = int(np.searchsorted(axis, high + half, side='right'))
+            windows.append(slice(min(start, len(axis) - 1), max(stop, start + 1)))
+        return tuple(windows)
+
+    def _render(self):
+        """Draws the visible window of the current frame, pooled down to at most max_cells cells."""
+        y_window, x_window = self._window()
+        window = self.frame[y_window, x_window]
+        self.factor = max(1, int(np.ceil(np.sqrt(window.size / float(self.max_cells))))) if self.max_cells else 1
+        pooled = downsample(window, self.factor, method=self.pooling)
+        dx, dy = _step(self.cube.x), _step(self.cube.y)
+        left = float(self.cube.x[x_window.start]) - dx / 2
+        bottom = float(self.cube.y[y_window.start]) - dy / 2
+        self.image.set_data(pooled)
+        self.image.set_extent((left, left + pooled.shape[1] * self.factor * dx,
+                               bottom, bottom + pooled.shape[0] * self.factor * dy))
+
+    def _on_zoom(self, ax):
+        if self._rendering or self.frame is None:
+            return
+        self._rendering = True
+        try:
+            self._render()
+        finally:
+            self._rendering = False
+
+    def full_frame(self):
+        """Returns the full resolution Y x X energies of the frame on display."""
+        return self.frame
+
+    def show(self, facet, energy_comp, rotation):
+        """
+        Displays one rotation of the chosen facet pair and energy component.
+
+        :param str facet: Facet pair, e.g. '100/011'
+        :param str energy_comp: Energy column
+        :param int rotation: Rotation of the frame
+        :return: obj : The figure
+        """
+        if self.key != (facet, energy_comp):
+            self._set_cube(facet, energy_comp)
+        self.rotation = rotation
+        self.frame = self.cube.frame(rotation)
+        self._rendering = True
+        try:
+            self._render()
+        finally:
+            self._rendering = False
+        finite = self.frame[~np.isnan(self.frame)]
+        if len(finite):
+            self.image.set_clim(finite.min(), finite.max())
+        density, _ = np.histogram(finite, bins=self.bins, density=len(finite) > 0)
+        for bar, height in zip(self.bars, density):
+            bar.set_height(height)
+        self.axs[1].set_ylim(0, max(density.max() * 1.05, 1e-9))
+        self.axs[1].set_title('Rotation {}'.format(rotation))
+        self.fig.canvas.draw_idle()
+        return self.fig
+
+    def export(self, path, **kwargs):
+        """
+        Saves the figure with the frame drawn at full resolution, whatever the level of detail on screen.
+
+        :param str path: File to write. The format follows the extension.
+        """
+        max_cells = self.max_cells
+        self.max_cells = None
+        try:
+            self._render()
+            self.fig.savefig(path, **kwargs)
+        finally:
+            self.max_cells = max_cells
+            self._render()
@@ -0,0 +1,244 @@
+import csv
+import importlib.util
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import numpy as np
+import pandas as pd
+
+# Raw SSIM energy totals and the normalised column each one is converted into
+ENERGY_COLUMNS = {'Interaction Energy': 'Total Energy',
+                  'Total ES Energy': 'Electrostatic',
+                  'Total VDW Energy': 'Van der Waals',
+                  'Total HB Energy': 'H-Bond'}
+COORD_COLUMNS = ['X axis Displacement', 'Y axis Displacement', 'Rotation']
+KCAL_TO_MJ = 6.94769E2  # kcal/mol per A^2 of contact area to mJ/m^2
+
+# Columns read from every SSIM output file and the type they are parsed as. Every other column is skipped.
+SCHEMA = dict([(col, 'float32') for col in COORD_COLUMNS] + [(raw, 'float64') for raw in ENERGY_COLUMNS])
+# pyarrow parses whole files several times faster than the C parser, it has no chunked reading though
+ENGINE = 'pyarrow' if importlib.util.find_spec('pyarrow') is not None else 'c'
+
+FACET_PATTERN = re.compile(r'\(([0-9\-]+)\)\S+\(([0-9\-]+)\)')
+AREA_PATTERN = re.compile(r'\_([0-9\-]+)\S+\_([0-9\-]+)')
+
+
+def parse_name(name):
+    """
+    Returns the (facet, area) encoded in an SSIM output file name, or None if the name does not match.
+
+    >>> parse_name('LGA(100)_403_LGA(1-10)_500.csv')
+    ('100/1-10', 403)
+    >>> parse_name('LGA_Morphology.csv') is None
+    True
+    """
+    t = FACET_PATTERN.search(name)
+    y = AREA_PATTERN.search(name)
+    if not t or not y:
+        return None
+    facet = t.group(1) + "/" + t.group(2)
+    try:
+        area = min(int(y.group(1)), int(y.group(2)))  # Finds out Area size based on file name
+    except ValueError:  # e.g. '_1-2_' matched where an area should be
+        return None
+    return facet, area
+
+
+def parse_names(names):
+    """
+    Parses the facet pair and area of many file names at once, collecting every malformed name instead of stopping
+    at the first. Gives the same result as parse_name on each name.
+
+    >>> parsed, malformed = parse_names(['LGA(100)_403_LGA(011)_500.csv', 'LGA_Morphology.csv',
+    ...                                  'LGA(001)_80_LGA(001)_60.csv', 'LGA(100)_1-2_LGA(011)_500.csv'])
+    >>> parsed
+    {'LGA(100)_403_LGA(011)_500.csv': ('100/011', 403), 'LGA(001)_80_LGA(001)_60.csv': ('001/001', 60)}
+    >>> malformed
+    ['LGA_Morphology.csv', 'LGA(100)_1-2_LGA(011)_500.csv']
+    >>> parse_name('LGA(100)_1-2_LGA(011)_500.csv') is None
+    True
+
+    :param list names: File names or paths
+    :return: tuple : ({name: (facet, area)}, [malformed names]) both in the order of names
+    """
+    names = pd.Series(list(names), dtype=object)
+    facets = names.str.extract(FACET_PATTERN)
+    areas = names.str.extract(AREA_PATTERN).apply(pd.to_numeric, errors='coerce')
+    ok = (facets.notnull().all(axis=1) & areas.notnull().all(axis=1)).to_numpy()
+    facet = (facets[0] + '/' + facets[1]).to_numpy()
+    area = areas.min(axis=1).to_numpy()
+    parsed = {name: (facet[n], int(area[n])) for n, name in enumerate(names) if ok[n]}
+    return parsed, list(names[~ok])
+
+
+def read_header(name):
+    """Returns the column names on the first line of a CSV file."""
+    with open(name, newline='') as f:
+        return next(csv.reader(f), [])
+
+
+def validate_header(name):
+    """Raises ValueError if the file lacks any SCHEMA column, before any row is parsed."""
+    header = set(read_header(name))
+    missing = [col for col in SCHEMA if col not in header]
+    if missing:
+        raise ValueError("{} is not an SSIM output file, it has no {} column(s)".format(name, ', '.join(missing)))
+
+
+def read_columns(name, chunksize=None, engine=None):
+    """
+    Reads only the SCHEMA columns of an SSIM output file with their declared types.
+
+    :param str name: Path of the file
+    :param int chunksize: Optional rows per chunk, returning an iterator of DataFrames (always the C parser)
+    :param str engine: read_csv engine. Defaults to ENGINE for whole files.
+    :return: obj : 'dataframe', or an iterator of them with chunksize
+    """
+    validate_header(name)
+    if engine is None:
+        engine = ENGINE if chunksize is None else 'c'
+    return pd.read_csv(name, usecols=list(SCHEMA), dtype=SCHEMA, engine=engine, chunksize=chunksize)
+
+
+def normalise(temp_df, area, dtype='float32'):
+    """Returns the displacement/rotation columns and the energies normalised to mJ/m^2 as a dict of arrays."""
+    columns = {col: temp_df[col].to_numpy(dtype=np.float32) for col in COORD_COLUMNS}
+    for raw, energy in ENERGY_COLUMNS.items():
+        # Whole column conversion in double precision before storing in the requested type
+        columns[energy] = ((temp_df[raw].to_numpy(dtype=np.float64) / area) * KCAL_TO_MJ).astype(dtype)
+    return columns
+
+
+def iter_ssim_chunks(names, chunksize=1000000, dtype='float32', failed=None):
+    """
+    Generator reading the SSIM output files in sorted order, chunksize rows at a time, so no more than one chunk is
+    held in memory.
+
+    :param list names: Paths of the files to read
+    :param int chunksize: Rows per chunk
+    :param str dtype: Float type of the normalised energies
+    :param list failed: Optional list that collects the names that could not be parsed
+    :return: generator of (name, facet, area, columns)
+    """
+    parsed, malformed = parse_names(sorted(names))
+    if failed is not None:
+        failed.extend(malformed)
+    for name, (facet, area) in parsed.items():
+        for temp_df in read_columns(name, chunksize=chunksize):
+            yield name, facet, area, normalise(temp_df, area, dtype=dtype)
+
+
+def _read_batch(files, dtype='float32'):
+    """Worker entry point. Reads a batch of (name, facet, area) and returns the parsed files."""
+    return [(name, facet, area, normalise(read_columns(name), area, dtype=dtype)) for name, facet, area in files]
+
+
+def _batches(names, n_batches):
+    """Splits the names into contiguous batches so results come back in the order of the names."""
+    size = max(1, -(-len(names) // n_batches))
+    return [names[i:i + size] for i in range(0, len(names), size)]
+
+
+def read_ssim_files(names, n_jobs=1, executor=None, dtype='float32'):
+    """
+    Reads every SSIM output file, optionally across a pool of worker processes.
+    Files are always processed in sorted filename order so the result is identical to the serial path.
+
+    :param list names: Paths of the files to read
+    :param int n_jobs: Number of worker processes. 1 reads serially, -1 uses every core.
+    :param obj executor: Optional concurrent.futures executor to use instead of creating a process pool
+    :param str dtype: Float type of the normalised energies, 'float32' or 'float64'
+    :return: tuple : (parsed, failed) where parsed is a list of (name, facet, area, columns) and failed a list of names
+    """
+    # Every name is parsed up front so malformed names are reported together before any file is read
+    parsed, failed = parse_names(sorted(names))
+    files = [(name, facet, area) for name, (facet, area) in parsed.items()]
+    if n_jobs is not None and n_jobs < 0:
+        n_jobs = os.cpu_count() or 1
+    if executor is None and (n_jobs is None or n_jobs <= 1 or len(files) < 2):
+        return _read_batch(files, dtype=dtype), failed
+
+    parsed = []
+    pool = executor if executor is not None else ProcessPoolExecutor(max_workers=n_jobs)
+    n_workers = getattr(pool, '_max_workers', None) or n_jobs or 1
+    try:
+        for worker_parsed in pool.map(partial(_read_batch, dtype=dtype), _batches(files, n_workers * 4)):
+            parsed.extend(worker_parsed)
+    finally:
+        if executor is None:
+            pool.shutdown()
+    return parsed, failed
+
+
+def group_by_facet(parsed):
+    """Stable reorder of the parsed files so files of the same facet pair are adjacent, pairs in order of appearance."""
+    first = {}
+    for n, (name, facet, area, columns) in enumerate(parsed):
+        first.setdefault(facet, n)
+    return sorted(parsed, key=lambda p: first[p[1]])
+
+
+def _compact_rotation(rotation):
+    """Stores the rotation as int16 when every angle is a whole number of degrees."""
+    if len(rotation) and np.all(np.mod(rotation, 1) == 0) and np.abs(rotation).max() < 2 ** 15:
+        return rotation.astype(np.int16)
+    return rotation
+
+
+def build_table(parsed):
+    """
+    Concatenates the parsed files column by column into one compact DataFrame.
+    'Facet' is categorical with the categories in order of first appearance.
+
+    :param list parsed: Parsed files as returned by read_ssim_files
+    :return: obj : 'dataframe' with the Facet, displacement, rotation and normalised energy columns
+    """
+    categories = []
+    positions = {}
+    codes = []
+    for name, facet, area, columns in parsed:
+        if facet not in positions:
+            positions[facet] = len(categories)
+            categories.append(facet)
+        codes.append(np.full(len(columns[COORD_COLUMNS[0]]), positions[facet], dtype=np.int32))
+    codes = np.concatenate(codes) if codes else np.empty(0, dtype=np.int32)
+    table = {'Facet': pd.Categorical.from_codes(codes, categories=categories)}
+    for col in COORD_COLUMNS + list(ENERGY_COLUMNS.values()):
+        arrays = [columns[col] for name, facet, area, columns in parsed]
+        table[col] = np.concatenate(arrays) if arrays else np.empty(0, dtype=np.float32)
+    table['Rotation'] = _compact_rotation(table['Rotation'])
+    return pd.DataFrame(table)
+
+
+def append_table(table, parsed):
+    """
+    Adds parsed files to a table from build_table, keeping every facet pair one contiguous block of rows.
+    New facet pairs are appended as new categories after the existing ones.
+
+    :param obj table: Table from build_table
+    :param list parsed: Parsed files as returned by read_ssim_files
+    :return: obj : New 'dataframe', the input table is not changed
+    """
+    if not parsed:
+        return table
+    new = build_table(group_by_facet(parsed))
+    categories = list(table['Facet'].cat.categories)
+    positions = {facet: n for n, facet in enumerate(categories)}
+    for facet in new['Facet'].cat.categories:
+        if facet not in positions:
+            positions[facet] = len(categories)
+            categories.append(facet)
+    remap = np.array([positions[facet] for facet in new['Facet'].cat.categories], dtype=np.int32)
+    codes = np.concatenate([table['Facet'].cat.codes.to_numpy().astype(np.int32),
+                            remap[new['Facet'].cat.codes.to_numpy()]])
+    # Rows of pairs that already existed are moved into their pair's block
+    order = None if np.all(np.diff(codes) >= 0) else np.argsort(codes, kind='stable')
+    merged = {}
+    for col in COORD_COLUMNS + list(ENERGY_COLUMNS.values()):
+        values = np.concatenate([table[col].to_numpy(), new[col].to_numpy()])
+        merged[col] = values if order is None else values[order]
+    codes = codes if order is None else codes[order]
+    merged['Rotation'] = _compact_rotation(merged['Rotation'])
+    return pd.DataFrame(dict({'Facet': pd.Categorical.from_codes(codes, categories=categories)}, **merged))
@@ -0,0 +1,164 @@
+"""Per stage timing and memory instrumentation of the analysis pipeline."""
+import logging
+import time
+import tracemalloc
+
+LOGGER = logging.getLogger('ssim_tool')
+
+
+class _NullStage:
+    """Stage of a disabled Instrument. Shared by every call so timing a stage costs one attribute lookup."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def add(self, rows=0, nbytes=0):
+        pass
+
+
+_NULL_STAGE = _NullStage()
+
+
+class _Stage:
+    def __init__(self, instrument, name):
+        self.instrument = instrument
+        self.name = name
+        self.rows = 0
+        self.nbytes = 0
+
+    def add(self, rows=0, nbytes=0):
+        """Adds to the rows and bytes the stage processed."""
+        self.rows += rows
+        self.nbytes += nbytes
+
+    def __enter__(self):
+        self.instrument._enter(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        seconds = time.perf_counter() - self.start
+        self.instrument._exit(self, seconds)
+        return False
+
+
+class Instrument:
+    """Records the time, rows, bytes and peak memory of each stage of a load, and counts cache hits and misses.
+
+    A disabled Instrument does no work: stage() returns a shared no-op context manager and the other methods return
+    straight away. Peak memory is the largest traced allocation above the memory in use when the stage started, from
+    tracemalloc, which NumPy and pandas report their arrays to. Tracing slows allocations down, so it is only started
+    with memory=True.
+
+    Attributes
+    ----------
+    stages : obj : 'list'
+        One dict per finished stage, in order of completion: stage, seconds, rows, bytes and, when tracing memory,
+        peak_mb.
+
+    files : obj : 'list'
+        One dict per data file read: file, facet, rows, file_bytes and bytes held in memory.
+
+    counters : obj : 'dict'
+        Cache hit and miss counts by name, e.g. 'files.hit' or 'cubes.miss'.
+    """
+
+    def __init__(self, enabled=True, memory=False, log=False, callback=None, level=logging.INFO):
+        """
+        :param bool enabled: False turns every method into a no-op
+        :param bool memory: True traces allocations to measure the peak memory of every stage
+        :param bool log: True logs every finished stage to the 'ssim_tool' logger
+        :param obj callback: Optional callable given the dict of every finished stage
+        :param int level: Logging level of the stage records
+        """
+        self.enabled = enabled
+        self.memory = memory and enabled
+        self.log = log
+        self.callback = callback
+        self.level = level
+        self.stages = []
+        self.files = []
+        self.counters = {}
+        self._open = []  # Running stages, innermost last, with the traced peak reached before each child started
+        self._tracing = False  # True while this object started tracemalloc
+
+    def stage(self, name):
+        """Context manager timing one stage. Its add(rows, nbytes) records the work done."""
+        if not self.enabled:
+            return _NULL_STAGE
+        return _Stage(self, name)
+
+    def count(self, name, hit):
+        """Counts one cache lookup as name.hit or name.miss."""
+        if self.enabled:
+            key = name + ('.hit' if hit else '.miss')
+            self.counters[key] = self.counters.get(key, 0) + 1
+
+    def add_counts(self, name, hits, misses):
+        """Adds several cache lookups at once."""
+        if self.enabled:
+            for key, n in ((name + '.hit', hits), (name + '.miss', misses)):
+                self.counters[key] = self.counters.get(key, 0) + n
+
+    def add_file(self, name, facet, rows, file_bytes, nbytes):
+        """Records one data file read."""
+        if self.enabled:
+            self.files.append({'file': name, 'facet': facet, 'rows': rows, 'file_bytes': file_bytes,
+                               'bytes': nbytes})
+
+    def _enter(self, stage):
+        if not self.memory:
+            return
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._tracing = True
+        current, peak = tracemalloc.get_traced_memory()
+        if self._open:
+            parent = self._open[-1]
+            parent.peak = max(parent.peak, peak)
+        tracemalloc.reset_peak()
+        stage.base = current
+        stage.peak = current
+        self._open.append(stage)
+
+    def _exit(self, stage, seconds):
+        record = {'stage': stage.name, 'seconds': seconds, 'rows': stage.rows, 'bytes': stage.nbytes}
+        if self.memory:
+            self._open.pop()
+            peak = max(stage.peak, tracemalloc.get_traced_memory()[1])
+            record['peak_mb'] = (peak - stage.base) / 2 ** 20
+            if self._open:
+                self._open[-1].peak = max(self._open[-1].peak, peak)
+            elif self._tracing:
+                tracemalloc.stop()
+                self._tracing = False
+        self.stages.append(record)
+        if self.log:
+            LOGGER.log(self.level, "%s took %.3f s (%d rows, %d bytes)%s", stage.name, seconds, stage.rows,
+                       stage.nbytes, ", peak %.1f MB" % record['peak_mb'] if 'peak_mb' in record else "")
+        if self.callback is not None:
+            self.callback(record)
+
+    def reset(self):
+        """Forgets every record, e.g. before a reload."""
+        self.stages = []
+        self.files = []
+        self.counters = {}
+
+    @property
+    def report(self):
+        """Structured report of the records: {'stages': [...], 'files': [...], 'counters': {...}, 'totals': {...}}."""
+        totals = {}
+        for record in self.stages:
+            total = totals.setdefault(record['stage'], {'calls': 0, 'seconds': 0.0, 'rows': 0, 'bytes': 0})
+            total['calls'] += 1
+            total['seconds'] += record['seconds']
+            total['rows'] += record['rows']
+            total['bytes'] += record['bytes']
+            if 'peak_mb' in record:
+                total['peak_mb'] = max(total.get('peak_mb', 0.0), record['peak_mb'])
+        return {'stages': list(self.stages), 'files': list(self.files), 'counters': dict(self.counters),
+                'totals': totals}
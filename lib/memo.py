@@ -0,0 +1,123 @@
+import sys
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+
+def nbytes(value):
+    """Approximate memory held by a cached value."""
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return int(np.sum(value.memory_usage(deep=True)))
+    if isinstance(value, pd.Index):
+        return value.memory_usage(deep=True)
+    if isinstance(value, (tuple, list)):
+        return sys.getsizeof(value) + sum(nbytes(v) for v in value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(nbytes(v) for v in value.values())
+    return sys.getsizeof(value)
+
+
+class QueryCache:
+    """Least recently used cache of the products derived from one dataset, kept under a memory budget.
+
+    Each entry records the energies it was computed from, so reweighting only drops the weighted products. Every
+    clear() moves the cache to a new version and a result built while the data changed (e.g. by the watch thread) is
+    returned but not stored, so a stale product is never served.
+
+    Attributes
+    ----------
+    version : int
+        Number of clears so far.
+
+    hits, misses : int
+        Lookups served from the cache and lookups that had to build their value.
+
+    A pickled copy (e.g. an SSIMAnalyse sent back from a pipeline worker) starts empty with a new lock:
+
+    >>> import pickle
+    >>> cache = QueryCache()
+    >>> cache.get('answer', lambda: 42)
+    42
+    >>> len(pickle.loads(pickle.dumps(cache)))
+    0
+    """
+
+    def __init__(self, max_bytes=256 * 2 ** 20, instrument=None):
+        """
+        :param int max_bytes: Memory budget. The least recently used entries are evicted to stay under it, and a
+                              single value larger than the budget is never stored.
+        :param obj instrument: Optional Instrument counting the lookups as 'queries' hits and misses
+        """
+        self.max_bytes = max_bytes
+        self.instrument = instrument
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        self.nbytes = 0
+        self._entries = OrderedDict()  # key -> (value, size, energies)
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        # Locks cannot be pickled, and the entries are cheap to rebuild, so a copy sent to another process starts empty
+        state = self.__dict__.copy()
+        del state['_lock']
+        state.update(_entries=OrderedDict(), nbytes=0)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, build, energies=()):
+        """
+        Returns the cached value of key, building and storing it on a miss.
+
+        :param tuple key: Hashable key, e.g. ('facet_list', weighted)
+        :param obj build: Callable with no arguments computing the value
+        :param list energies: Energy columns the value is computed from
+        :return: The value
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+            version = self.version
+        if self.instrument is not None:
+            self.instrument.count('queries', entry is not None)
+        if entry is not None:
+            return entry[0]
+        value = build()
+        size = nbytes(value)
+        with self._lock:
+            if version == self.version and size <= self.max_bytes:
+                old = self._entries.pop(key, None)
+                if old is not None:
+                    self.nbytes -= old[1]
+                self._entries[key] = (value, size, frozenset(energies))
+                self.nbytes += size
+                while self.nbytes > self.max_bytes:
+                    evicted = self._entries.popitem(last=False)[1]
+                    self.nbytes -= evicted[1]
+        return value
+
+    def clear(self, energies=None):
+        """Drops every entry, or only those computed from the given energies, and starts a new version."""
+        with self._lock:
+            self.version += 1
+            if energies is None:
+                self._entries.clear()
+                self.nbytes = 0
+                return
+            energies = set(energies)
+            for key in [key for key, entry in self._entries.items() if entry[2] & energies]:
+                self.nbytes -= self._entries.pop(key)[1]
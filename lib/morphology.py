@@ -0,0 +1,106 @@
+import os
+from glob import glob
+
+import numpy as np
+import pandas as pd
+
+# Morphology objects already parsed, keyed on the (path, size, mtime) of every file they were built from.
+_MORPHOLOGY_CACHE = {}
+
+
+def read_morphology(path):
+    """
+    Reads a single morphology file and returns the facet areas as fractions of the total crystal area.
+
+    :param str path: Path of the morphology csv holding the 'hkl' and '% Total facet area' columns
+    :return: obj : Series of absolute facet areas indexed by the hkl stripped of brackets and white space
+    """
+    morph_df = pd.read_csv(path, usecols=['% Total facet area', 'hkl'])
+    morph_df = morph_df[pd.notnull(morph_df['% Total facet area'])]  # Drops all rows which contain NaN
+    hkl = morph_df['hkl'].astype(str).str.replace(r'({)|(})|(\s)', '', regex=True)
+    return pd.Series(morph_df['% Total facet area'].to_numpy(dtype=float) / 100, index=hkl.to_numpy(),
+                     name='Total facet area')
+
+
+class Morphology:
+    """Holds the facet areas of one or two morphology files and the probability of every facet-facet collision.
+
+    The probability of facet hkl1 (first file) hitting facet hkl2 (second file) is the product of their absolute
+    surface areas. The full matrix is built once as an outer product so a lookup is a dictionary hit plus an array index.
+
+    Attributes
+    ----------
+    files : obj : 'tuple'
+        Morphology files used. If only one file was found it is used for both sides.
+
+    hkl1, hkl2 : obj : 'list'
+        Facets of the first and second morphology file, in file order.
+
+    matrix : obj : 'ndarray'
+        Probability matrix of shape (len(hkl1), len(hkl2)).
+    """
+
+    def __init__(self, files):
+        """
+        :param list files: One or two morphology files. The first file gives the left facet of a pair.
+        """
+        files = list(files)
+        if not files:
+            raise ValueError("No morphology files supplied")
+        if len(files) == 1:
+            files.append(files[0])
+        self.files = tuple(files)
+        areas = [read_morphology(m) for m in self.files[:2]]
+        self.hkl1 = areas[0].index.tolist()
+        self.hkl2 = areas[1].index.tolist()
+        self.matrix = np.outer(areas[0].to_numpy(), areas[1].to_numpy())
+        self._pos1 = {hkl: n for n, hkl in enumerate(self.hkl1)}
+        self._pos2 = {hkl: n for n, hkl in enumerate(self.hkl2)}
+
+    def probability(self, hkl1, hkl2):
+        """Returns the collision probability of the facet pair or NaN if either facet is not in the tables."""
+        i = self._pos1.get(hkl1)
+        j = self._pos2.get(hkl2)
+        if i is None or j is None:
+            return np.nan
+        return self.matrix[i, j]
+
+    def pair_probabilities(self, facets):
+        """
+        Vectorised lookup of many facet pairs written as 'hkl1/hkl2'.
+
+        :param list facets: Facet pair labels
+        :return: obj : 'ndarray' of probabilities, NaN where a pair is missing from the morphology tables
+        """
+        facets = list(facets)
+        i = np.array([self._pos1.get(f.split('/')[0], -1) for f in facets], dtype=np.intp)
+        j = np.array([self._pos2.get(f.split('/')[-1], -1) for f in facets], dtype=np.intp)
+        found = (i >= 0) & (j >= 0)
+        out = np.full(len(facets), np.nan)
+        out[found] = self.matrix[i[found], j[found]]
+        return out
+
+    def to_dict(self):
+        """Returns the probabilities in the nested {hkl1: {hkl2: probability}} layout of morphology_extraction."""
+        return {hkl1: dict(zip(self.hkl2, self.matrix[i].tolist())) for i, hkl1 in enumerate(self.hkl1)}
+
+
+def load_morphology(morph_path):
+    """
+    Finds the morphology files matching morph_path and returns a shared Morphology object for them.
+    Objects are cached, so every SSIMAnalyse pointing at the same unchanged files reuses one parse.
+
+    :param str morph_path: Glob pattern for the morphology files (example 'C:\\Data\\**\\*LGA_Morphology*.csv')
+    :return: obj : Morphology or None if no files were found
+    """
+    if morph_path is None:
+        return None
+    files = glob(morph_path, recursive=True)  # Search through all folders and find all file names
+    if not files:
+        return None
+    key = tuple((os.path.abspath(f), os.path.getsize(f), os.path.getmtime(f)) for f in files[:2])
+    morphology = _MORPHOLOGY_CACHE.get(key)
+    if morphology is None:
+        morphology = Morphology(files[:2])
+        _MORPHOLOGY_CACHE[key] = morphology
+    return morphology
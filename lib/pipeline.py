@@ -0,0 +1,209 @@
+"""Batch analysis of many API/excipient systems producing summary tables.
+
+The manifest is a JSON list (or {"systems": [...]}) or a CSV with one system per entry:
+
+    name        unique label used in the output tables, the data_path if omitted
+    morph_path  glob of the morphology file(s)
+    data_path   glob of the SSIM output files
+    role        'probe' or 'excipient'
+    cache_dir   optional analysis cache directory
+
+Every system is ingested concurrently, then the tables below are written to the output folder:
+
+    facet_pairs   count, mean, std and median of every energy for every facet pair of every system
+    summary       describe() statistics of every energy of every system
+    cab           cab_matrix of every probe x excipient pair, unweighted and weighted
+    cab_ranking   excipients of every probe ranked by CAB gradient
+    failed_files  data files whose names could not be parsed
+
+The exit code is 0 on success and 2 if any data file failed filename parsing.
+
+    python -m lib.pipeline systems.json --out results --format csv parquet --jobs 8
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+from lib import ingest
+
+ENERGIES = list(ingest.ENERGY_COLUMNS.values())
+ALL_ENERGIES = ENERGIES + ['Weighted ' + energy for energy in ENERGIES]
+ROLES = ('probe', 'excipient')
+
+
+def read_manifest(path):
+    """
+    Reads the systems manifest.
+
+    :param str path: JSON or CSV manifest
+    :return: list : One dict per system with name, morph_path, data_path, role and cache_dir
+    """
+    if path.lower().endswith('.csv'):
+        # As objects first, as where() cannot put None in a float column, e.g. an all empty cache_dir
+        systems = pd.read_csv(path).astype(object).where(lambda df: df.notnull(), None).to_dict('records')
+    else:
+        with open(path) as f:
+            systems = json.load(f)
+        if isinstance(systems, dict):
+            systems = systems['systems']
+    for n, system in enumerate(systems):
+        missing = [key for key in ('morph_path', 'data_path', 'role') if not system.get(key)]
+        if missing:
+            raise ValueError("System {} of the manifest is missing {}".format(n, ', '.join(missing)))
+        if system['role'] not in ROLES:
+            raise ValueError("System {} has role '{}', expected one of {}".format(n, system['role'], ROLES))
+        if not system.get('name'):
+            system['name'] = system['data_path']  # The whole glob, as many systems share a basename like '*.csv'
+        system['cache_dir'] = system.get('cache_dir') or None
+        if system['cache_dir'] is not None and not isinstance(system['cache_dir'], str):
+            raise ValueError("System {} has cache_dir {!r}, expected a folder path".format(n, system['cache_dir']))
+    names = [system['name'] for system in systems]
+    duplicates = sorted({name for name in names if names.count(name) > 1})
+    if duplicates:
+        raise ValueError("System names must be unique, got {} more than once".format(', '.join(duplicates)))
+    return systems
+
+
+def _ingest_system(system, n_jobs=1, streaming=False):
+    """Worker: builds the SSIMAnalyse of one system."""
+    from ssim_tool import SSIMAnalyse
+    return SSIMAnalyse(system['morph_path'], system['data_path'], n_jobs=n_jobs, cache_dir=system.get('cache_dir'),
+                       streaming=streaming)
+
+
+def ingest_systems(systems, jobs=1, n_jobs=1, streaming=False, progress=None):
+    """
+    Builds the SSIMAnalyse of every system, several systems at a time.
+
+    :param list systems: Systems from read_manifest
+    :param int jobs: Number of systems ingested at once in separate processes
+    :param int n_jobs: Worker processes used inside each system for reading files
+    :param bool streaming: True builds statistics only (see SSIMAnalyse streaming)
+    :param obj progress: Optional callable taking a message
+    :return: dict : {name: SSIMAnalyse} in manifest order
+    """
+    progress = progress or (lambda message: None)
+    results = {}
+    if jobs is None or jobs <= 1:
+        for n, system in enumerate(systems):
+            results[system['name']] = _ingest_system(system, n_jobs=n_jobs, streaming=streaming)
+            progress("[{}/{}] ingested {}".format(n + 1, len(systems), system['name']))
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            futures = {pool.submit(_ingest_system, system, n_jobs, streaming): system['name'] for system in systems}
+            for n, future in enumerate(as_completed(futures)):
+                results[futures[future]] = future.result()
+                progress("[{}/{}] ingested {}".format(n + 1, len(systems), futures[future]))
+    return {system['name']: results[system['name']] for system in systems}
+
+
+def facet_pair_table(analyses):
+    """Tidy table of count, mean, std and median of every energy for every facet pair of every system."""
+    frames = []
+    for name, analysis in analyses.items():
+        for energy in ALL_ENERGIES:
+            stats = analysis.pair_statistics(energy, median=True).reset_index()
+            stats.insert(0, 'Energy', energy)
+            stats.insert(0, 'System', name)
+            stats['Probability'] = analysis.probabilities.reindex(stats['Facet']).to_numpy()
+            frames.append(stats)
+    return pd.concat(frames, ignore_index=True)
+
+
+def summary_table(analyses):
+    """Tidy table of the describe() statistics of every energy of every system."""
+    rows = []
+    for name, analysis in analyses.items():
+        for energy in ALL_ENERGIES:
+            row = analysis.describe(energy).to_dict()
+            row.update(System=name, Energy=energy)
+            rows.append(row)
+    columns = ['System', 'Energy', 'count', 'mean', 'std', 'min', '25%', '50%', '75%', 'max']
+    return pd.DataFrame(rows)[columns]
+
+
+def cab_table(analyses, roles, median=False, n_jobs=1):
+    """Tidy cab_matrix table of every probe x excipient pair, unweighted and weighted."""
+    from ssim_tool import cab_matrix
+    probes = {name: analysis for name, analysis in analyses.items() if roles[name] == 'probe'}
+    excipients = {name: analysis for name, analysis in analyses.items() if roles[name] == 'excipient'}
+    return pd.concat([cab_matrix(probes, excipients, weighted=weighted, median=median, n_jobs=n_jobs)
+                      for weighted in (False, True)], ignore_index=True)
+
+
+def write_table(table, out_dir, name, formats):
+    """Writes a table as <name>.<fmt> for every format in csv, parquet and json."""
+    paths = []
+    for fmt in formats:
+        path = os.path.join(out_dir, '{}.{}'.format(name, fmt))
+        if fmt == 'csv':
+            table.to_csv(path, index=False)
+        elif fmt == 'parquet':
+            table.to_parquet(path, index=False)  # Needs pyarrow or fastparquet
+        elif fmt == 'json':
+            table.to_json(path, orient='records', indent=1)
+        else:
+            raise ValueError("Unknown format {}".format(fmt))
+        paths.append(path)
+    return paths
+
+
+def run(systems, out_dir, formats=('csv',), jobs=1, n_jobs=1, streaming=False, median=False, progress=None):
+    """
+    Runs the whole pipeline and writes the tables.
+
+    :return: dict : {'analyses': {name: SSIMAnalyse}, 'failed': DataFrame of failed files, 'outputs': [paths]}
+    """
+    progress = progress or (lambda message: None)
+    start = time.time()
+    analyses = ingest_systems(systems, jobs=jobs, n_jobs=n_jobs, streaming=streaming, progress=progress)
+    roles = {system['name']: system['role'] for system in systems}
+    os.makedirs(out_dir, exist_ok=True)
+
+    outputs = []
+    progress("Computing facet pair statistics")
+    outputs += write_table(facet_pair_table(analyses), out_dir, 'facet_pairs', formats)
+    progress("Computing energy summaries")
+    outputs += write_table(summary_table(analyses), out_dir, 'summary', formats)
+    progress("Computing CAB tables")
+    cab = cab_table(analyses, roles, median=median, n_jobs=jobs)
+    outputs += write_table(cab, out_dir, 'cab', formats)
+    from ssim_tool import rank_excipients
+    outputs += write_table(rank_excipients(cab), out_dir, 'cab_ranking', formats)
+    failed = pd.DataFrame([(name, path) for name, analysis in analyses.items() for path in analysis.failed_files],
+                          columns=['System', 'File'])
+    outputs += write_table(failed, out_dir, 'failed_files', formats)
+    progress("Finished in {:.1f} s".format(time.time() - start))
+    return {'analyses': analyses, 'failed': failed, 'outputs': outputs}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Batch SSIM analysis of many probe/excipient systems.")
+    parser.add_argument('manifest', help="JSON or CSV manifest of the systems")
+    parser.add_argument('--out', required=True, help="Output folder for the tables")
+    parser.add_argument('--format', nargs='+', default=['csv'], choices=['csv', 'parquet', 'json'])
+    parser.add_argument('--jobs', type=int, default=1, help="Systems ingested at once, -1 for every core")
+    parser.add_argument('--n-jobs', type=int, default=1, help="Worker processes reading files within a system")
+    parser.add_argument('--streaming', action='store_true', help="Bounded memory statistics only ingestion")
+    parser.add_argument('--median', action='store_true', help="Use the median in the CAB tables")
+    args = parser.parse_args(argv)
+
+    def progress(message):
+        print(message, file=sys.stderr, flush=True)
+
+    jobs = os.cpu_count() or 1 if args.jobs < 0 else args.jobs
+    result = run(read_manifest(args.manifest), args.out, formats=args.format, jobs=jobs, n_jobs=args.n_jobs,
+                 streaming=args.streaming, median=args.median, progress=progress)
+    if len(result['failed']):
+        progress("{} data files failed filename parsing, see failed_files".format(len(result['failed'])))
+        return 2
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
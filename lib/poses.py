@@ -0,0 +1,111 @@
+import numpy as np
+import pandas as pd
+
+POSE_COLUMNS = ['X axis Displacement', 'Y axis Displacement', 'Rotation']
+VALUE = 'Interaction Energy(mJ/m^2)'
+
+
+def lowest_k(codes, values, k):
+    """
+    Finds the k lowest values of every group in one sort.
+
+    :param obj codes: Integer group of every row
+    :param obj values: Value of every row. NaN is never selected.
+    :param int k: Number of rows kept per group
+    :return: tuple : (rows, rank) positions of the selected rows ordered by group then value, and their 1-based rank
+    """
+    codes = np.asarray(codes)
+    values = np.asarray(values)
+    order = np.lexsort((values, codes))  # NaN sorts last inside each group
+    sorted_codes = codes[order]
+    rank = np.arange(len(order)) - np.searchsorted(sorted_codes, sorted_codes, side='left')
+    keep = (rank < k) & ~np.isnan(values[order])
+    return order[keep], rank[keep] + 1
+
+
+def top_poses(data, energies, k=5, probabilities=None):
+    """
+    Tidy table of the k strongest binding poses (lowest energies) of every facet pair and energy component.
+
+    :param obj data: Table with the 'Facet', displacement, rotation and energy columns
+    :param list energies: Energy columns to search. 'Weighted ...' energies are searched on their unweighted column,
+                          since a pair probability does not change the order of its poses, and then scaled.
+    :param int k: Number of poses per facet pair and energy. k=1 gives the global minimum.
+    :param obj probabilities: Collision probability of every facet category, needed for 'Weighted ...' energies
+    :return: obj : Dataframe with Facet, Energy, Rank, the pose columns and the energy
+    """
+    codes = data['Facet'].cat.codes.to_numpy()
+    categories = data['Facet'].cat.categories
+    poses = {col: data[col].to_numpy() for col in POSE_COLUMNS}
+    frames = []
+    for energy in energies:
+        weighted = energy.startswith('Weighted ')
+        values = data[energy[len('Weighted '):] if weighted else energy].to_numpy()
+        rows, rank = lowest_k(codes, values, k)
+        found = values[rows]
+        if weighted:
+            found = found * np.asarray(probabilities, dtype=values.dtype)[codes[rows]]
+            keep = ~np.isnan(found)  # Pairs missing from the morphology have no weighted energies
+            rows, rank, found = rows[keep], rank[keep], found[keep]
+        frame = {'Facet': pd.Categorical.from_codes(codes[rows], categories=categories),
+                 'Energy': energy,
+                 'Rank': rank}
+        frame.update((col, poses[col][rows]) for col in POSE_COLUMNS)
+        frame[VALUE] = found
+        frames.append(pd.DataFrame(frame))
+    return pd.concat(frames, ignore_index=True)
+
+
+def local_minimum_mask(cube_values, periodic_rotation=True):
+    """
+    Marks the grid points no higher than any of their 26 neighbours on the rotation x Y x X grid.
+
+    :param obj cube_values: Array of shape (rotation, Y, X). NaN cells are never minima and never block one.
+    :param bool periodic_rotation: True wraps the rotation axis so the last rotation neighbours the first
+    :return: obj : Boolean array of the same shape
+    """
+    values = np.where(np.isnan(cube_values), np.inf, cube_values)
+    padded = np.pad(values, ((0, 0), (1, 1), (1, 1)), constant_values=np.inf)
+    if periodic_rotation and values.shape[0] > 1:
+        padded = np.pad(padded, ((1, 1), (0, 0), (0, 0)), mode='wrap')
+    else:
+        padded = np.pad(padded, ((1, 1), (0, 0), (0, 0)), constant_values=np.inf)
+    nr, ny, nx = values.shape
+    mask = np.isfinite(values)
+    for dr in (0, 1, 2):
+        for dy in (0, 1, 2):
+            for dx in (0, 1, 2):
+                if dr == dy == dx == 1:
+                    continue
+                mask &= values <= padded[dr:dr + nr, dy:dy + ny, dx:dx + nx]
+    return mask
+
+
+def local_minima(get_cube, facets, energies, rotation_period=360):
+    """
+    Tidy table of every local minimum of the energy surface of each facet pair and energy component.
+
+    :param obj get_cube: Callable (facet, energy) returning the EnergyCube of a facet pair
+    :param list facets: Facet pairs to search
+    :param list energies: Energy columns to search
+    :param float rotation_period: Rotation is wrapped when the sampled rotations cover this period
+    :return: obj : Dataframe with Facet, Energy, the pose columns and the energy, lowest first within each pair
+    """
+    frames = []
+    for energy in energies:
+        for facet in facets:
+            cube = get_cube(facet, energy)
+            rotations = cube.rotations
+            step = rotations[1] - rotations[0] if len(rotations) > 1 else rotation_period
+            periodic = bool(np.isclose(rotations[-1] - rotations[0] + step, rotation_period))
+            r, y, x = np.nonzero(local_minimum_mask(cube.values, periodic_rotation=periodic))
+            found = cube.values[r, y, x]
+            order = np.argsort(found, kind='stable')
+            frames.append(pd.DataFrame({'Facet': facet, 'Energy': energy,
+                                        'X axis Displacement': cube.x[x[order]],
+                                        'Y axis Displacement': cube.y[y[order]],
+                                        'Rotation': rotations[r[order]],
+                                        VALUE: found[order]}))
+    if not frames:
+        return pd.DataFrame(columns=['Facet', 'Energy'] + POSE_COLUMNS + [VALUE])
+    return pd.concat(frames, ignore_index=True)
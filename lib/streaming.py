@@ -0,0 +1,290 @@
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import numpy as np
+import pandas as pd
+
+from lib import ingest
+
+ENERGIES = list(ingest.ENERGY_COLUMNS.values())
+
+
+class QuantileSketch:
+    """Mergeable quantile sketch with a bounded relative error (logarithmic buckets, as in DDSketch).
+
+    Every value is counted in the bucket ceil(log(|x|) / log(gamma)) of its sign, so any quantile is returned within a
+    relative error of accuracy. Two sketches merge by adding their bucket counts.
+    """
+
+    def __init__(self, accuracy=0.01):
+        self.accuracy = accuracy
+        self.gamma = (1 + accuracy) / (1 - accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.positive = {}
+        self.negative = {}
+        self.zero = 0
+
+    @property
+    def count(self):
+        return self.zero + sum(self.positive.values()) + sum(self.negative.values())
+
+    def _add(self, store, values, weights):
+        keys = np.ceil(np.log(values) / self._log_gamma).astype(np.int64)
+        keys, inverse = np.unique(keys, return_inverse=True)
+        counts = np.bincount(inverse, weights=weights, minlength=len(keys))
+        for key, count in zip(keys.tolist(), counts.tolist()):
+            store[key] = store.get(key, 0) + count
+
+    def update(self, values, weights=None):
+        """Adds an array of values, optionally with a count (weight) for each."""
+        values = np.asarray(values, dtype=np.float64).ravel()
+        weights = np.ones(len(values)) if weights is None else np.asarray(weights, dtype=np.float64)
+        keep = ~np.isnan(values)
+        values, weights = values[keep], weights[keep]
+        positive = values > 0
+        negative = values < 0
+        self.zero += weights[~(positive | negative)].sum()
+        if positive.any():
+            self._add(self.positive, values[positive], weights[positive])
+        if negative.any():
+            self._add(self.negative, -values[negative], weights[negative])
+        return self
+
+    def merge(self, other):
+        """Adds the counts of another sketch with the same accuracy."""
+        for store, other_store in ((self.positive, other.positive), (self.negative, other.negative)):
+            for key, count in other_store.items():
+                store[key] = store.get(key, 0) + count
+        self.zero += other.zero
+        return self
+
+    def _centres(self):
+        """Returns the representative value and count of every bucket in ascending value order."""
+        neg = sorted(self.negative, reverse=True)
+        pos = sorted(self.positive)
+        values = [-2 * self.gamma ** k / (self.gamma + 1) for k in neg] + [0.0] + \
+                 [2 * self.gamma ** k / (self.gamma + 1) for k in pos]
+        counts = [self.negative[k] for k in neg] + [self.zero] + [self.positive[k] for k in pos]
+        return np.array(values), np.array(counts, dtype=np.float64)
+
+    def quantile(self, q):
+        """Returns the q quantile (0 <= q <= 1), or NaN for an empty sketch."""
+        values, counts = self._centres()
+        total = counts.sum()
+        if total == 0:
+            return np.nan
+        rank = q * (total - 1)
+        return float(values[np.searchsorted(np.cumsum(counts), rank, side='right')])
+
+    def scaled(self, factor):
+        """Returns a new sketch of the values multiplied by factor."""
+        values, counts = self._centres()
+        return QuantileSketch(self.accuracy).update(values * factor, counts)
+
+
+class OnlineStatistics:
+    """Mergeable running count, mean, M2 (for the variance), min, max and quantile sketch of a stream of values."""
+
+    def __init__(self, accuracy=0.01):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = np.inf
+        self.max = -np.inf
+        self.sketch = QuantileSketch(accuracy)
+
+    def _combine(self, count, mean, m2, low, high):
+        """Chan et al. parallel update of the moments with a block of already summarised values."""
+        if count == 0:
+            return
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean += delta * count / total
+        self.m2 += m2 + delta ** 2 * self.count * count / total
+        self.count = total
+        self.min = min(self.min, low)
+        self.max = max(self.max, high)
+
+    def update(self, values):
+        """Adds an array of values. NaN is ignored."""
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        if len(values):
+            mean = values.mean()
+            self._combine(len(values), mean, ((values - mean) ** 2).sum(), values.min(), values.max())
+            self.sketch.update(values)
+        return self
+
+    def merge(self, other):
+        """Adds the statistics of another accumulator."""
+        self._combine(other.count, other.mean, other.m2, other.min, other.max)
+        self.sketch.merge(other.sketch)
+        return self
+
+    def scaled(self, factor):
+        """Returns the statistics of the values multiplied by a non-negative factor (e.g. a collision probability)."""
+        out = OnlineStatistics(self.sketch.accuracy)
+        out.count = self.count
+        out.mean = self.mean * factor
+        out.m2 = self.m2 * factor ** 2
+        out.min = self.min * factor
+        out.max = self.max * factor
+        out.sketch = self.sketch.scaled(factor)
+        return out
+
+    @property
+    def std(self):
+        return math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else np.nan
+
+    def quantile(self, q):
+        return self.sketch.quantile(q)
+
+    def describe(self):
+        """Returns a Series laid out like pandas Series.describe()."""
+        empty = self.count == 0
+        return pd.Series({'count': self.count,
+                          'mean': np.nan if empty else self.mean,
+                          'std': self.std,
+                          'min': np.nan if empty else self.min,
+                          '25%': self.quantile(0.25),
+                          '50%': self.quantile(0.5),
+                          '75%': self.quantile(0.75),
+                          'max': np.nan if empty else self.max})
+
+
+class PairStatistics:
+    """Online statistics of every energy component for every facet pair, built without holding the data.
+
+    Attributes
+    ----------
+    stats : obj : 'dict'
+        {facet pair: {energy: OnlineStatistics}} in order of first appearance of the pair.
+
+    failed : obj : 'list'
+        Files whose names could not be parsed.
+    """
+
+    def __init__(self, accuracy=0.01):
+        self.accuracy = accuracy
+        self.stats = {}
+        self.failed = []
+
+    @property
+    def pairs(self):
+        return list(self.stats)
+
+    def update(self, facet, columns):
+        """Adds one chunk of normalised columns of a facet pair."""
+        pair = self.stats.get(facet)
+        if pair is None:
+            pair = self.stats[facet] = {energy: OnlineStatistics(self.accuracy) for energy in ENERGIES}
+        for energy in ENERGIES:
+            pair[energy].update(columns[energy])
+        return self
+
+    def merge(self, other):
+        """Adds the statistics of another PairStatistics (e.g. from another worker)."""
+        for facet, energies in other.stats.items():
+            pair = self.stats.get(facet)
+            if pair is None:
+                self.stats[facet] = energies
+            else:
+                for energy, stats in energies.items():
+                    pair[energy].merge(stats)
+        self.failed.extend(other.failed)
+        return self
+
+    def _get(self, facet, energy, probabilities):
+        """Returns the statistics of one pair, scaled by its probability for 'Weighted ...' energies."""
+        if energy.startswith('Weighted '):
+            p = probabilities.get(facet, np.nan) if probabilities is not None else np.nan
+            stats = self.stats[facet][energy[len('Weighted '):]]
+            return stats.scaled(p) if p == p else OnlineStatistics(self.accuracy)
+        return self.stats[facet][energy]
+
+    def combined(self, facets, energy, probabilities=None):
+        """
+        Merges the statistics of several facet pairs.
+
+        :param list facets: Facet pairs to merge
+        :param str energy: Energy column, 'Weighted ...' columns are scaled by the pair probabilities
+        :param dict probabilities: {facet pair: collision probability} used for weighted energies
+        :return: obj : OnlineStatistics
+        """
+        out = OnlineStatistics(self.accuracy)
+        for facet in facets:
+            out.merge(self._get(facet, energy, probabilities))
+        return out
+
+    def pair_table(self, energy, probabilities=None):
+        """Returns count, mean, std, min, max and median of one energy for every facet pair."""
+        rows = {facet: self._get(facet, energy, probabilities) for facet in self.stats}
+        return pd.DataFrame({'count': [s.count for s in rows.values()],
+                             'mean': [s.mean if s.count else np.nan for s in rows.values()],
+                             'std': [s.std for s in rows.values()],
+                             'min': [s.min if s.count else np.nan for s in rows.values()],
+                             'max': [s.max if s.count else np.nan for s in rows.values()],
+                             'median': [s.quantile(0.5) for s in rows.values()]},
+                            index=pd.Index(list(rows), name='Facet'))
+
+    def side_statistics(self, energy, side, median=False, probabilities=None):
+        """
+        Statistics of one energy for every facet on the chosen side of the pairs, laid out like
+        FacetIndex.side_statistics.
+
+        :param str side: 'left', 'right' or 'either'
+        """
+        groups = {}
+        for facet in self.stats:
+            left, right = facet.split('/')
+            if side == 'left':
+                keys = [left]
+            elif side == 'right':
+                keys = [right]
+            else:
+                keys = [left] if left == right else [left, right]
+            for key in keys:
+                groups.setdefault(key, []).append(facet)
+        merged = {key: self.combined(facets, energy, probabilities) for key, facets in groups.items()}
+        stats = pd.DataFrame({'count': [s.count for s in merged.values()],
+                              'mean': [s.mean if s.count else np.nan for s in merged.values()],
+                              'std': [s.std for s in merged.values()]},
+                             index=pd.Index(list(merged), name='Facet'))
+        if median:
+            stats['median'] = [s.quantile(0.5) for s in merged.values()]
+        return stats
+
+
+def _summarise_batch(names, chunksize=1000000, accuracy=0.01):
+    """Worker entry point. Streams a batch of files into a PairStatistics."""
+    stats = PairStatistics(accuracy)
+    for name, facet, area, columns in ingest.iter_ssim_chunks(names, chunksize=chunksize, dtype='float64',
+                                                               failed=stats.failed):
+        stats.update(facet, columns)
+    return stats
+
+
+def stream_statistics(names, chunksize=1000000, n_jobs=1, accuracy=0.01):
+    """
+    Summarises SSIM output files chunk by chunk without materialising the data. Workers each summarise a batch of
+    files and their accumulators are merged, so memory is bounded by one chunk per worker plus the accumulators.
+
+    :param list names: Paths of the SSIM output files
+    :param int chunksize: Rows read at a time from each file
+    :param int n_jobs: Number of worker processes. -1 uses every core.
+    :param float accuracy: Relative accuracy of the median and percentiles
+    :return: obj : PairStatistics
+    """
+    names = sorted(names)
+    if n_jobs is not None and n_jobs < 0:
+        n_jobs = os.cpu_count() or 1
+    work = partial(_summarise_batch, chunksize=chunksize, accuracy=accuracy)
+    if not n_jobs or n_jobs <= 1 or len(names) < 2:
+        return work(names)
+    stats = PairStatistics(accuracy)
+    with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+        for worker_stats in pool.map(work, ingest._batches(names, n_jobs * 4)):
+            stats.merge(worker_stats)
+    return stats
@@ -0,0 +1,145 @@
+"""Synthetic SSIM datasets for benchmarking and trying the tool without a real campaign.
+
+A dataset folder holds a morphology CSV ('hkl', '% Total facet area') and one SSIM output CSV per facet pair, named
+the way the analysis parses them:
+
+    <root>/morphology/<name>_Morphology.csv
+    <root>/data/<name>(<hkl1>)_<area1>_<name>(<hkl2>)_<area2>.csv
+
+Every pair file samples an X x Y displacement grid at every rotation step. The energy surface is a binding well whose
+depth and position depend on the pair and the rotation, with noise, so minima, distributions and CAB plots look
+like real output. The interaction energy is the sum of its electrostatic, van der Waals and H-bond parts.
+
+    python -m lib.synthetic out_dir --facets 6 --grid 20 --rotation-step 15
+"""
+import argparse
+import itertools
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from lib.ingest import COORD_COLUMNS, ENERGY_COLUMNS
+
+# Low index facets first, as they dominate real morphologies
+_INDICES = sorted((hkl for hkl in itertools.product(range(-1, 3), repeat=3) if any(hkl)),
+                  key=lambda hkl: (sum(abs(i) for i in hkl), sum(i < 0 for i in hkl), [-i for i in hkl]))
+
+
+def facet_labels(n_facets):
+    """
+    Returns n_facets Miller indices written like the analysis labels them.
+
+    >>> facet_labels(4)
+    ['100', '010', '001', '00-1']
+    """
+    if n_facets > len(_INDICES):
+        raise ValueError("At most {} facets can be generated".format(len(_INDICES)))
+    return [''.join(str(i) for i in hkl) for hkl in _INDICES[:n_facets]]
+
+
+def write_morphology(path, n_facets, rng):
+    """Writes the morphology of the first n_facets facets, where the first ones cover most of the surface."""
+    area = rng.gamma(2.0, size=n_facets) / np.arange(1, n_facets + 1)
+    pd.DataFrame({'hkl': ['{{{} {} {}}}'.format(*hkl) for hkl in _INDICES[:n_facets]],
+                  '% Total facet area': area / area.sum() * 100}).to_csv(path, index=False)
+
+
+def pair_table(rng, grid=10, rotation_step=30, spacing=0.5, rows=None, depth=-15.0, extra_columns=1):
+    """
+    Builds the SSIM output of one facet pair.
+
+    :param obj rng: numpy Generator
+    :param int grid: Points along each of X and Y
+    :param int rotation_step: Degrees between rotations
+    :param float spacing: Displacement between grid points (Angstrom)
+    :param int rows: Optional number of rows, cutting the grid short
+    :param float depth: Mean depth of the binding well (kcal/mol)
+    :param int extra_columns: Unused columns added like the extra output of SSIM
+    :return: obj : 'dataframe' with the raw SSIM columns
+    """
+    rotations = np.arange(0, 360, rotation_step)
+    r, y, x = (a.ravel() for a in np.meshgrid(rotations, np.arange(grid) * spacing, np.arange(grid) * spacing,
+                                              indexing='ij'))
+    if rows is not None:
+        r, y, x = r[:rows], y[:rows], x[:rows]
+    extent = max(grid - 1, 1) * spacing
+    centre = rng.uniform(0, extent, 2)
+    theta = np.deg2rad(r)
+    # Well that drifts and changes depth with rotation, on a periodic surface corrugation
+    cx = centre[0] + 0.15 * extent * np.cos(theta)
+    cy = centre[1] + 0.15 * extent * np.sin(theta)
+    width = 0.25 * extent + spacing
+    well = np.exp(-((x - cx) ** 2 + (y - cy) ** 2) / (2 * width ** 2)) * (1 + 0.3 * np.cos(2 * theta))
+    corrugation = np.cos(2 * np.pi * x / (4 * spacing)) * np.cos(2 * np.pi * y / (4 * spacing))
+    scale = depth * rng.uniform(0.6, 1.4)
+    vdw = 0.6 * scale * well + 0.5 * corrugation + rng.normal(0, 0.5, len(r))
+    es = 0.3 * scale * well * np.cos(theta + rng.uniform(0, np.pi)) + rng.normal(0, 0.5, len(r))
+    hb = np.where(rng.random(len(r)) < 0.1 * well, rng.exponential(2.0, len(r)) * np.sign(scale), 0.0)
+    raw = dict(zip(COORD_COLUMNS, (x, y, r)))
+    raw.update(zip(ENERGY_COLUMNS, (vdw + es + hb, es, vdw, hb)))
+    for n in range(extra_columns):
+        raw['Extra {}'.format(n)] = rng.normal(size=len(r))
+    return pd.DataFrame(raw)
+
+
+def generate(root=None, n_facets=4, grid=10, rotation_step=30, rows=None, spacing=0.5, name='LGA', seed=0,
+             extra_columns=1):
+    """
+    Writes a synthetic dataset with a morphology file and one SSIM output file per facet pair.
+
+    :param str root: Output folder. Defaults to a new temporary directory.
+    :param int n_facets: Number of facets, giving n_facets ** 2 pair files
+    :param int grid: Points along each of X and Y
+    :param int rotation_step: Degrees between rotations
+    :param int rows: Optional rows per pair file, cutting the grid short
+    :param float spacing: Displacement between grid points (Angstrom)
+    :param str name: Molecule label used in the file names
+    :param int seed: Seed of the random energies
+    :param int extra_columns: Unused columns per file
+    :return: dict : root, morph_path and data_path globs for SSIMAnalyse, the facets, the files and the total rows
+    """
+    root = tempfile.mkdtemp(prefix='ssim_synthetic_') if root is None else root
+    rng = np.random.default_rng(seed)
+    facets = facet_labels(n_facets)
+    os.makedirs(os.path.join(root, 'morphology'), exist_ok=True)
+    os.makedirs(os.path.join(root, 'data'), exist_ok=True)
+    write_morphology(os.path.join(root, 'morphology', '{}_Morphology.csv'.format(name)), n_facets, rng)
+    areas = dict(zip(facets, rng.integers(300, 700, len(facets))))
+    files = []
+    total = 0
+    for hkl1, hkl2 in itertools.product(facets, repeat=2):
+        table = pair_table(rng, grid=grid, rotation_step=rotation_step, spacing=spacing, rows=rows,
+                           extra_columns=extra_columns)
+        path = os.path.join(root, 'data', '{0}({1})_{2}_{0}({3})_{4}.csv'.format(name, hkl1, areas[hkl1], hkl2,
+                                                                                 areas[hkl2]))
+        table.to_csv(path, index=False)
+        files.append(path)
+        total += len(table)
+    return {'root': root,
+            'morph_path': os.path.join(root, 'morphology', '*_Morphology.csv'),
+            'data_path': os.path.join(root, 'data', '*.csv'),
+            'facets': facets,
+            'files': files,
+            'rows': total}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write a synthetic SSIM dataset.")
+    parser.add_argument('root', nargs='?', default=None, help="Output folder, a temporary one if omitted")
+    parser.add_argument('--facets', type=int, default=4)
+    parser.add_argument('--grid', type=int, default=10)
+    parser.add_argument('--rotation-step', type=int, default=30)
+    parser.add_argument('--rows', type=int, default=None, help="Rows per pair file")
+    parser.add_argument('--name', default='LGA')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+    dataset = generate(args.root, n_facets=args.facets, grid=args.grid, rotation_step=args.rotation_step,
+                       rows=args.rows, name=args.name, seed=args.seed)
+    print("Wrote {} files ({} rows) to {}".format(len(dataset['files']), dataset['rows'], dataset['root']))
+    print("SSIMAnalyse({!r}, {!r})".format(dataset['morph_path'], dataset['data_path']))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,35 @@
 import seaborn as sns
-import pandas as pd
+import numpy as np
 import matplotlib.pyplot as plt
 
+from lib.density import bandwidth_factor, binned_kde
 
-def draw_violin(data, energy_comp, energy_comp2, facet_list, ylimit, title,bw,inner,orient):
+# The violins are drawn from densities, not the individual values, so seaborn's 'stick' and 'point' are not available
+INNER = (None, 'box', 'quartile')
+
+
+def check_options(bw, inner):
+    """Raises a ValueError for a bw or inner the violins cannot be drawn with."""
+    bandwidth_factor(bw, 1)
+    if inner not in INNER:
+        raise ValueError("inner must be one of {}, got {!r}. 'stick' and 'point' need every value and are not "
+                         "drawn from the cached densities".format(INNER, inner))
+
+
+def _quartiles(grid, density):
+    """Quartiles read off the cumulative density."""
+    cdf = np.cumsum(density)
+    if cdf[-1] <= 0:
+        return [np.nan] * 3
+    return np.interp([0.25, 0.5, 0.75], cdf / cdf[-1], grid)
+
+
+def draw_violin(data, energy_comp, energy_comp2, facet_list, ylimit, title,bw,inner,orient, densities=None):
     """
     Draws violin plots based on widget selections and data set from SSIM.
     If two different energy compmenets are selected the violin plots are split in two.
+    The violins are drawn from binned FFT KDEs, so only the selected facets are drawn and nothing is re-estimated
+    when densities are passed in.
 
     :param obj data: Interaction data for multiple facets interacting
     :param str energy_comp: Uses Widget energy compnent number 1
@@ -14,36 +37,76 @@ def draw_violin(data, energy_comp, energy_comp2, facet_list, ylimit, title,bw,in
     :param str facet_list: uses widget list of facet available
     :param floats ylimit: Takes list of two number for the y axis scale
     :param str title:  Takes the title of the graph.
+    :param float bw: Bandwidth factor of the KDE, or 'scott' or 'silverman'
+    :param str inner: None, 'quartile' for lines at the quartiles or 'box' for the interquartile range and median
+    :param str orient: 'v' for vertical violins or 'h' for horizontal
+    :param obj densities: Optional callable (energy, facet, bw) returning a cached (grid, density), e.g. the
+                          density method of an SSIMAnalyse. Without it the densities are estimated from data.
     :return: Violin Graphs
     """
 
+    check_options(bw, inner)
     sns.set(style="whitegrid", palette="pastel", color_codes=True, context='paper', font_scale=2.1)
     a4_dims = (11.7, 8.27)
-    g = plt.subplots(figsize=a4_dims)
+    fig, g = plt.subplots(figsize=a4_dims)
 
     if energy_comp == energy_comp2:
         split_val = False
     else:
         split_val = True
-    temp_list = []
-    col_names = [energy_comp, energy_comp2]
-   # print("DATA FILE = "+ str(data))
-    for col in col_names:
-    #    print("Col Name = "+ str(col))
-        df_new = data[[col, 'Facet']]
-        df_new = df_new.rename(columns={col: 'Interaction Energy(mJ/m^2)'})
-        df_new['Energy Contribution'] = col
-        temp_list.append(df_new)
-    df_data = pd.concat(temp_list)
-
-    g = sns.violinplot(x='Facet', y='Interaction Energy(mJ/m^2)', data=df_data, hue="Energy Contribution",
-                       split=split_val, order=facet_list,
-                       inner=inner, bw=bw, orient=orient)
-
-    g.set_xticklabels(g.get_xticklabels(), rotation=30)
-    g.set(ylim=ylimit)
+    if densities is None:
+        codes = data['Facet'].to_numpy()
+
+        def densities(energy, facet, bw):
+            return binned_kde(data[energy].to_numpy()[codes == facet], bw=bw)
+
+    col_names = [energy_comp, energy_comp2] if split_val else [energy_comp]
+    facet_list = list(facet_list)
+    curves = {(col, facet): densities(col, facet, bw) for col in col_names for facet in facet_list}
+    # Every violin has the same area, so widths are scaled by the largest density on the plot
+    peak = max([density.max() for grid, density in curves.values()] + [1e-12])
+    colors = sns.color_palette("pastel", 2)
+    vertical = orient != "h"
+    fill = g.fill_betweenx if vertical else g.fill_between
+    line = (lambda pos, val, **kw: g.plot(pos, val, **kw)) if vertical else \
+        (lambda pos, val, **kw: g.plot(val, pos, **kw))
+
+    for n, facet in enumerate(facet_list):
+        for side, col in enumerate(col_names):
+            grid, density = curves[(col, facet)]
+            width = density / peak * 0.4
+            left = n - width if (not split_val or side == 0) else np.full(len(width), float(n))
+            right = n + width if (not split_val or side == 1) else np.full(len(width), float(n))
+            fill(grid, left, right, facecolor=colors[side], edgecolor='grey', linewidth=1,
+                 label=col if n == 0 else None)
+            if inner in ('quartile', 'box'):
+                q1, q2, q3 = _quartiles(grid, density)
+                offset = -0.05 if split_val and side == 0 else (0.05 if split_val else 0)
+                if inner == 'box':
+                    line([n + offset] * 2, [q1, q3], color='k', linewidth=4)
+                    line([n + offset], [q2], color='w', marker='o', markersize=4)
+                else:
+                    for q, style in ((q1, ':'), (q2, '--'), (q3, ':')):
+                        half = np.interp(q, grid, width)
+                        lo = n - half if (not split_val or side == 0) else n
+                        hi = n + half if (not split_val or side == 1) else n
+                        line([lo, hi], [q, q], color='k', linestyle=style, linewidth=1)
+
+    ticks = range(len(facet_list))
+    if vertical:
+        g.set_xticks(ticks)
+        g.set_xticklabels(facet_list, rotation=30)
+        g.set(ylim=ylimit)
+        g.set_xlabel('Facets', fontsize=20)
+        g.set_ylabel('Interaction Energy(mJ/m^2)', fontsize=20)
+    else:
+        g.set_yticks(ticks)
+        g.set_yticklabels(facet_list)
+        g.invert_yaxis()
+        g.set(xlim=ylimit)
+        g.set_ylabel('Facets', fontsize=20)
+        g.set_xlabel('Interaction Energy(mJ/m^2)', fontsize=20)
     g.set_title(title)
-    g.set_xlabel('Facets', fontsize=20)
-    g.set_ylabel('Interaction Energy(mJ/m^2)', fontsize=20)
     g.tick_params(labelsize=15)
     g.legend(loc='lower right')
+    return g
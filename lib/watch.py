@@ -0,0 +1,91 @@
+import threading
+import time
+import traceback
+from glob import glob
+
+from lib.cache import file_signature
+
+
+class DirectoryWatcher:
+    """Polls a glob pattern from a background thread and hands over files once they have finished being written.
+
+    A file counts as complete when its size and modification time are the same on two polls in a row and it has not
+    been modified for settle seconds, so files still being written by a running SSIM campaign are left alone.
+
+    Attributes
+    ----------
+    known : obj : 'set'
+        Files already handed over (or present at the start), which are never reported again. Files are only added
+        once the callback returns, so a batch whose callback raised is handed over again on a later poll.
+
+    error : obj : 'BaseException'
+        Last exception raised by the callback, which is printed and does not stop the thread.
+    """
+
+    def __init__(self, pattern, callback, known=(), interval=30.0, settle=10.0):
+        """
+        :param str pattern: Glob of the data files, searched recursively
+        :param obj callback: Called with the list of newly completed files
+        :param list known: Files that are already ingested
+        :param float interval: Seconds between polls
+        :param float settle: Seconds a file must be unmodified before it is handed over
+        """
+        self.pattern = pattern
+        self.callback = callback
+        self.known = set(known)
+        self.interval = interval
+        self.settle = settle
+        self.error = None
+        self._pending = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def poll(self):
+        """Checks the pattern once and returns the complete files not yet in known. They stay out of known until
+        the caller has handled them, see _run."""
+        now = time.time()
+        pending = {}
+        complete = []
+        for name in glob(self.pattern, recursive=True):
+            if name in self.known:
+                continue
+            try:
+                signature = file_signature(name)
+            except OSError:  # Removed between the glob and the stat
+                continue
+            if self._pending.get(name) == signature and now - signature[1] / 1e9 >= self.settle:
+                complete.append(name)
+            pending[name] = signature  # Complete files too, so a batch that failed is retried on the next poll
+        self._pending = pending
+        return sorted(complete)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                complete = self.poll()
+                if complete:
+                    self.callback(complete)
+                    self.known.update(complete)
+            except Exception as e:
+                self.error = e
+                traceback.print_exc()
+            self._stop.wait(self.interval)
+
+    def start(self):
+        """Starts polling in a daemon thread."""
+        if not self.running:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='ssim-watch', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        """Stops polling, waiting for a poll in progress to finish."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._thread = None
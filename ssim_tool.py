@@ -1,9 +1,35 @@
+# The analysis core only needs pandas and NumPy. ipywidgets and the plotting modules (matplotlib, seaborn,
+# scikit-learn) are imported the first time a plotting method is called.
+import functools as _functools
+import numpy as _np
+import os as _os
+import threading as _threading
 import pandas as _pd
-from lib import violinplots, heatmaps, cabplots
 from glob import glob as _glob
-import re as _re
-from ipywidgets import fixed, widgets
-from lib import distribution as _dis
+from lib import ingest as _ingest
+from lib import bootstrap as _bootstrap
+from lib import cab as _cab
+from lib import poses as _poses
+from lib.cache import AnalysisCache as _AnalysisCache
+from lib.cubes import build_cube as _build_cube
+from lib.density import DensityCache as _DensityCache
+from lib.facetindex import FacetIndex as _FacetIndex
+from lib.instrument import Instrument as _Instrument
+from lib.memo import QueryCache as _QueryCache
+from lib.morphology import load_morphology as _load_morphology
+from lib.streaming import stream_statistics as _stream_statistics
+from lib.watch import DirectoryWatcher as _DirectoryWatcher
+
+_ENERGIES = list(_ingest.ENERGY_COLUMNS.values())
+
+
+def _synchronised(method):
+    """Runs the method under the object's lock, so add_files from the watch thread never swaps the data mid-call."""
+    @_functools.wraps(method)
+    def locked(self, *args, **kwargs):
+        with self._lock:
+            return method(self, *args, **kwargs)
+    return locked
 
 
 class SSIMAnalyse:
@@ -17,7 +43,7 @@ class SSIMAnalyse:
     weighted_data: obj:'dataframe'
         Dataframe holding all the normalised interactions to the area of the smallest surface and converted to mJ/m^2 from kcal/mol.
         This has been weighted to the probabily of the two surfaces colliding. The probability is calculated by multiplying the surface %
-        of each given surface with the one interacting
+        of each given surface with the one interacting. The weighted columns are computed each time it is accessed.
 
     whole_list : obj : 'str'
         List containing all the facet combinations from the morphology table supplied.
@@ -25,19 +51,64 @@ class SSIMAnalyse:
     col_options : obj : 'str'
         List containing all energy type calculations.
 
+    failed_files : obj : 'str'
+        List of the data files whose names could not be parsed into facets and areas.
+
+    cache : obj : 'AnalysisCache'
+        On-disk cache used when cache_dir is given, holding the hit/miss counts of the last load.
+
+    probabilities : obj : 'series'
+        Collision probability of every facet pair, NaN for pairs missing from the morphology tables. The 'Weighted'
+        energies are not stored, they are the unweighted energies scaled by these when they are used.
+
+    missing_pairs : obj : 'list'
+        Facet pairs missing from the morphology tables, whose weighted energies are NaN.
+
+    watcher : obj : 'DirectoryWatcher'
+        Background poller of data_path while watch() is following a running campaign, else None.
+
+    statistics : obj : 'PairStatistics'
+        Per facet pair online statistics, built instead of data_all in streaming mode.
+
+    instrument : obj : 'Instrument'
+        Stage timers, per file rows and bytes, peak memory and cache hit/miss counts. Disabled unless instrument is
+        given, see report.
+
+    queries : obj : 'QueryCache'
+        Least recently used cache of the facet list, energy options and statistics the widgets ask for, kept under
+        query_cache_bytes and cleared when the data or the weights change.
+
     data_all : obj : 'dataframe'
         Dataframe holding all the normalised interactions to the area of the smallest surface and converted to mJ/m^2 from kcal/mol.
-        As well as extra information.
+        As well as extra information. Facet is categorical, the displacements float32, the rotation int16 where possible
+        and the energies float32 (or float64). violin_data and heatmap_data are views of this one table.
+        With mmap the columns are read-only memory maps of the files in cache_dir.
 
     """
 
-    def __init__(self, morph_path, data_path, save_path=None,printing=False):
+    def __init__(self, morph_path, data_path, save_path=None,printing=False, n_jobs=1, executor=None,
+                 dtype='float32', cache_dir=None, streaming=False, chunksize=1000000, mmap=False, instrument=False,
+                 query_cache_bytes=256 * 2 ** 20):
         """
         Initiates the Class
 
         :param str morph_path: Path required for the location of the Morphology File (example 'C:\Data\**\*LGA_Morphology*.csv')
         :param str data_path: Path required for the location of all the Data Files  (example ' C:\Data\**\*LGA*)_*.csv')
-        :param str save_path: Path required for saving imags   (example ' C:\Data\') UNDER DEVELOPMENT
+        :param str save_path: Path required for saving imags   (example ' C:\Data\') used by export()
+        :param int n_jobs: Number of worker processes used to read the data files. -1 uses every core.
+        :param obj executor: Optional concurrent.futures executor used to read the data files instead of a new process pool
+        :param str dtype: Float type used to store the energies, 'float32' (default) or 'float64'
+        :param str cache_dir: Optional directory caching the normalised table. Only new or changed files are parsed
+                              on later constructions and deleted files are dropped.
+        :param bool streaming: True summarises the files chunk by chunk into per facet pair statistics instead of
+                               loading them. data_all is not built, so only the statistics methods are available.
+        :param int chunksize: Rows read at a time in streaming mode
+        :param bool mmap: True memory-maps the columns of data_all from cache_dir instead of holding them in memory.
+                          Pages are read as they are used and shared by every process mapping the same cache_dir.
+        :param instrument: True records the time, rows and bytes of every load stage and the cache hit/miss counts in
+                           report. An Instrument can be given instead to also trace peak memory or to emit every stage
+                           through logging or a callback.
+        :param int query_cache_bytes: Memory budget of the cached widget queries (queries)
         """
         """ 
 
@@ -50,12 +121,37 @@ class SSIMAnalyse:
         self.morph_path = morph_path
         self.data_path = data_path
         self.save_path = save_path
-        self.violin_data = None
         self.data_all = None
-        self.heatmap_data = None
         self.whole_list = None
-        self.weighted_data = None
         self.col_options = None
+        self.morphology = None
+        self.failed_files = []
+        self.n_jobs = n_jobs
+        self.executor = executor
+        self.dtype = dtype
+        self.cache_dir = cache_dir
+        self.cache = None
+        self.facet_index = None
+        self._side_stats = {}
+        self._cubes = {}
+        if not isinstance(instrument, _Instrument):
+            instrument = _Instrument(enabled=bool(instrument))
+        self.instrument = instrument
+        self._densities = _DensityCache(self._density_values, instrument=instrument)
+        self.queries = _QueryCache(query_cache_bytes, instrument=instrument)
+        self.probabilities = None
+        self.missing_pairs = []
+        self.watcher = None
+        self._files = set()
+        self._update_callbacks = {}
+        self._lock = _threading.RLock()  # Guards the data and the caches derived from it
+        self._add_lock = _threading.Lock()  # One add_files at a time, so no file is merged twice
+        self.streaming = streaming
+        self.chunksize = chunksize
+        self.statistics = None
+        if mmap and cache_dir is None:
+            raise ValueError("mmap needs a cache_dir to map the columns from")
+        self.mmap = mmap
 
         self.analyse(printing=printing)
 
@@ -65,102 +161,372 @@ class SSIMAnalyse:
 
         Extracts the Morphology Data from the morphology file by splitting the hkl into just the numbers. Cross references between
         two morphology files and creates every combination possible. If only 1 morphology file is given it duplicates it.
+        The parsed morphology is cached on the object and shared between objects pointing at the same files.
 
         :return: obj : Dictonary of all facet combinations and their associated probabilities
         """
+        if self.morphology is None:
+            self.morphology = _load_morphology(self.morph_path)
+        if self.morphology is None:
+            return {}
+        return self.morphology.to_dict()
 
-        morph_files = [x for x in
-                       _glob(self.morph_path, recursive=True)]  # Search through all folders and find all file names
-        if len(morph_files) == 1:
-            morph_files.append(morph_files[0])
-        morph_data = []
-        for m in morph_files:  # Go through all files
-            morph_df1 = _pd.read_csv(m, usecols=['% Total facet area', 'hkl'])  # Read in every files into DataFrame
-            morph_df1 = morph_df1[_pd.notnull(morph_df1['% Total facet area'])]  # Drops all rows which contain NaN
-            morph_df1['hkl'] = morph_df1['hkl'].str.replace('({)|(})|(\s)',
-                                                            '')  # Gets rid of white space and currly brackets
-            morph_df1['Total facet area'] = morph_df1['% Total facet area'] / 100  # Convert % to absolute
-            morph_df1 = morph_df1.set_index(morph_df1['hkl'])
-            morph_data.append(morph_df1)  # Create list of dataframes
-        columns = morph_data[0]['hkl'].tolist()  # Create lists of hkl for column and index
-        index = morph_data[1]['hkl'].tolist()  #
-        morph_df = _pd.DataFrame(index=index, columns=columns)  # Creates an empty dataframe
-        # Create multiply all the probabilities together
-        for i in columns:
-            for j in index:
-                product = morph_data[0].loc[i]['Total facet area'] * morph_data[1].loc[j]['Total facet area']
-                morph_df.loc[j][i] = product
-        morph_dict = morph_df.to_dict()  # convert to dictonary
-        return morph_dict
-
+    @_synchronised
     def analyse(self, printing=False):
         """
         Analyses the data from the files passes to the objects
         :param bool printing:  True will print all facets calculated plus the probability from surface areas
         :return: obj containg the analysed interaction data
         """
-        def find_lowest(area1, area2):  # Find the lowest value of area
-            if area1 == area2:
-                return area1
-            if area1 < area2:
-                return area1
-            else:
-                return area2
-
+        instrument = self.instrument
+        instrument.reset()
         if self.data_path is not None:
-            names = [x for x in _glob(self.data_path, recursive=True)]  # Parse All the file names into the names var
+            with instrument.stage('glob') as stage:
+                # Parse All the file names into the names var
+                names = [x for x in _glob(self.data_path, recursive=True)]
+                stage.add(rows=len(names))
         else:
             print("Please point to correct folder as no files were found that end in .csv")
             return
 
-        data_all = []
+        if self.morphology is None:
+            with instrument.stage('morphology'):
+                self.morphology = _load_morphology(self.morph_path)
+        self._files = set(names)
+
         print("Facets Processed")
-        for n in names:
-            t = _re.search('\(([0-9\-]+)\)\S+\(([0-9\-]+)\)', n)
-            y = _re.search('\_([0-9\-]+)\S+\_([0-9\-]+)', n)
-            if t:
-                var = t.group(1) + "/" + t.group(2)
-                temp_df = _pd.read_csv(n)
-                if printing: print("Facets Interacting:", var)
-                temp_df['Facet'] = var
-                area = find_lowest(int(y.group(1)), int(y.group(2)))  # Finds out Area size based on file name
-                if printing: print("Area used : " + str(area))
-                temp_df['Total Energy'] = temp_df['Interaction Energy'].apply(lambda row: (row / area) * 6.94769E2)
-                temp_df['Electrostatic'] = temp_df['Total ES Energy'].apply(lambda row: (row / area) * 6.94769E2)
-                temp_df['Van der Waals'] = temp_df['Total VDW Energy'].apply(lambda row: (row / area) * 6.94769E2)
-                temp_df['H-Bond'] = temp_df['Total HB Energy'].apply(lambda row: (row / area) * 6.94769E2)
-                morph_dict = self.morphology_extraction()
-                try:
-                    probability = morph_dict[t.group(1)][t.group(2)]
-                    if printing: print("       Probability:", probability)
-                    temp_df['Weighted Total Energy'] = temp_df['Total Energy'].apply(lambda row: row * probability)
-                    temp_df['Weighted Electrostatic'] = temp_df['Electrostatic'].apply(lambda row: row * probability)
-                    temp_df['Weighted Van der Waals'] = temp_df['Van der Waals'].apply(lambda row: row * probability)
-                    temp_df['Weighted H-Bond'] = temp_df['H-Bond'].apply(lambda row: row * probability)
-                except:
-                    if printing: print(
-                        "Probability does not exist in table. Please check the current facets have been calculated")
-                    data_all.append(temp_df)
-                    continue
-                data_all.append(temp_df)
+        if self.streaming:
+            with instrument.stage('stream'):
+                self._analyse_streaming(names, printing=printing)
+            return
+        morph_files = sorted(set(self.morphology.files)) if self.morphology is not None else []
+        with instrument.stage('read') as stage:
+            if self.cache_dir is not None:
+                # Only files that are new or changed since the cache was written are parsed
+                self.cache = _AnalysisCache(self.cache_dir, dtype=self.dtype)
+                parsed, self.failed_files = self.cache.read(names, n_jobs=self.n_jobs, executor=self.executor,
+                                                            morph_files=morph_files)
+                instrument.add_counts('files', self.cache.hits, self.cache.misses)
             else:
-                print("Failed on {} ".format(n))
-        violin_data = _pd.concat(data_all)
-        self.data_all = violin_data
-        weighted_data = violin_data[
-            ['Facet', 'Weighted Total Energy', 'Weighted Electrostatic', 'Weighted Van der Waals', 'Weighted H-Bond']]
-        violin_data2 = violin_data[['Facet', 'Total Energy', 'Electrostatic', 'Van der Waals', 'H-Bond']]
-        self.col_options = violin_data[['Total Energy', 'Electrostatic', 'Van der Waals', 'H-Bond',
-                                        'Weighted Total Energy', 'Weighted Electrostatic', 'Weighted Van der Waals',
-                                        'Weighted H-Bond']].columns
-        self.whole_list = violin_data['Facet'].unique()
-        self.weighted_data = weighted_data
-        self.violin_data = violin_data2
-        self.heatmap_data = violin_data
+                parsed, self.failed_files = _ingest.read_ssim_files(names, n_jobs=self.n_jobs, executor=self.executor,
+                                                                       dtype=self.dtype)
+            if instrument.enabled:
+                for name, facet, area, columns in parsed:
+                    rows = len(next(iter(columns.values())))
+                    nbytes = sum(col.nbytes for col in columns.values())
+                    instrument.add_file(name, facet, rows, _os.path.getsize(name), nbytes)
+                    stage.add(rows=rows, nbytes=nbytes)
+        for n in self.failed_files:
+            print("Failed on {} ".format(n))
+        if printing:
+            for n, var, area, columns in parsed:
+                print("Facets Interacting:", var)
+                print("Area used : " + str(area))
+        parsed = _ingest.group_by_facet(parsed)  # Every facet pair becomes one contiguous block of rows
+        if self.mmap and not self.cache.changed:
+            with instrument.stage('load_mmap'):
+                data_all = self.cache.load_table()
+        else:
+            with instrument.stage('build_table') as stage:
+                data_all = _ingest.build_table(parsed)
+                stage.add(rows=len(data_all), nbytes=int(data_all.memory_usage(index=False).sum()))
+            if self.cache is not None and self.cache.changed:
+                with instrument.stage('cache_save'):
+                    self.cache.save(parsed, self.failed_files, data_all, morph_files=morph_files)
+                    if self.mmap:  # Drop the in memory copy for the mapped one
+                        data_all = self.cache.load_table()
+        # Probabilities are looked up once per facet pair and applied when a weighted energy is used
+        with instrument.stage('index'):
+            facets = data_all['Facet'].cat.categories
+            self._set_probabilities(facets, printing=printing)
+            self.data_all = data_all
+            self.col_options = _pd.Index(_ENERGIES + ['Weighted ' + col for col in _ENERGIES])
+            self.whole_list = facets.to_numpy()
+            self.facet_index = _FacetIndex(data_all['Facet'])
+        self._side_stats = {}
+        self._cubes = {}
+        self._densities.clear()
+        self.queries.clear()
         print("Number of facet combinations : " + str(len(names)))
 
+    def _set_probabilities(self, facets, printing=False):
+        """Looks up the collision probability of every facet pair in the morphology tables."""
+        if self.morphology is not None:
+            pair_probability = self.morphology.pair_probabilities(facets)
+        else:
+            pair_probability = _np.full(len(facets), _np.nan)
+        if printing:
+            for facet, probability in zip(facets, pair_probability):
+                if probability == probability:
+                    print(facet, "       Probability:", probability)
+                else:
+                    print(facet, "       Probability does not exist in table. "
+                                 "Please check the current facets have been calculated")
+        self.probabilities = _pd.Series(pair_probability, index=_pd.Index(list(facets), name='Facet'))
+        self.missing_pairs = list(self.probabilities.index[self.probabilities.isnull()])
+        if self.missing_pairs and not printing:
+            print("No morphology probability for {} facet pairs, their weighted energies are NaN: {}".format(
+                len(self.missing_pairs), ', '.join(self.missing_pairs)))
+
+    @_synchronised
+    def reweight(self, morph_path, printing=False):
+        """
+        Weights the energies with another morphology, e.g. a different growth condition, without re-reading the data.
+        Only the probabilities change, so only the cached weighted statistics, cubes and densities are dropped.
+
+        :param str morph_path: Path of the new Morphology File(s)
+        :param bool printing: True prints the probability of every facet pair
+        """
+        self.morph_path = morph_path
+        self.morphology = _load_morphology(morph_path)
+        self._set_probabilities(self.whole_list, printing=printing)
+        weighted = ['Weighted ' + col for col in _ENERGIES]
+        self._side_stats = {key: stats for key, stats in self._side_stats.items() if key[0] not in weighted}
+        self._cubes = {key: cube for key, cube in self._cubes.items() if key[1] not in weighted}
+        self._densities.clear(energies=weighted)
+        self.queries.clear(energies=weighted)
+
+    def add_files(self, names, printing=False):
+        """
+        Parses data files that were not ingested yet and merges them into the analysis, without re-reading the others.
+        The facet list, probabilities and facet index are rebuilt, cached cubes and densities are dropped only for the
+        facet pairs that gained rows, and the callbacks registered with on_update are called. With mmap the merged table
+        is held in memory, the cache picks the new files up on the next construction. A file that cannot be read is
+        listed in failed_files and does not stop the others being merged.
+
+        :param list names: Paths of the data files
+        :param bool printing: True prints the probability of every facet pair
+        :return: list : Facet pairs that gained rows
+        """
+        with self._add_lock:
+            return self._merge_files(names, printing=printing)
+
+    def _merge_files(self, names, printing=False):
+        # Files are read without the lock, so the widgets stay responsive, then merged and swapped in under it
+        with self._lock:
+            names = sorted(n for n in set(names) if n not in self._files)
+        if not names:
+            return []
+        if self.data_all is None:
+            results, errors = self._read_each(names, lambda batch: _stream_statistics(
+                batch, chunksize=self.chunksize, n_jobs=self.n_jobs))
+            new = results[0] if results else _stream_statistics([])
+            for other in results[1:]:
+                new.merge(other)
+            new.failed.extend(errors)
+            failed = list(new.failed)
+            changed = new.pairs
+        else:
+            with self.instrument.stage('read') as stage:
+                results, errors = self._read_each(names, lambda batch: _ingest.read_ssim_files(
+                    batch, n_jobs=self.n_jobs, executor=self.executor, dtype=self.dtype))
+                parsed = [p for batch_parsed, batch_failed in results for p in batch_parsed]
+                failed = [n for batch_parsed, batch_failed in results for n in batch_failed] + errors
+                changed = list(dict.fromkeys(facet for name, facet, area, columns in parsed))
+                stage.add(rows=sum(len(columns[_ingest.COORD_COLUMNS[0]]) for name, facet, area, columns in parsed))
+        for n in failed:
+            print("Failed on {} ".format(n))
+        with self._lock:
+            if self.data_all is None:
+                self.statistics.merge(new)  # Also extends failed_files, which is the statistics' failed list
+                facets = self.statistics.pairs
+            else:
+                with self.instrument.stage('add_files') as stage:
+                    data_all = _ingest.append_table(self.data_all, parsed)
+                    stage.add(rows=len(data_all) - len(self.data_all))
+                    self.data_all, self.facet_index = data_all, _FacetIndex(data_all['Facet'])
+                facets = data_all['Facet'].cat.categories
+                self.failed_files = self.failed_files + failed
+            self._set_probabilities(facets, printing=printing)
+            self.whole_list = _np.array(list(facets), dtype=object)
+            self._files.update(names)
+            # Side statistics mix every pair so they are all recomputed, cubes and densities only for the changed pairs
+            self._side_stats = {}
+            self._cubes = {key: cube for key, cube in self._cubes.items() if key[0] not in changed}
+            self._densities.clear(facets=changed + [None])
+            self.queries.clear()
+        print("Added {} files, {} facet pairs updated".format(len(names), len(changed)))
+        for callback in list(self._update_callbacks.values()):
+            callback(changed)
+        return changed
+
+    @staticmethod
+    def _read_each(names, read):
+        """
+        Reads the files in one call of read, or one file at a time if that raises, so a file with a bad header or
+        body does not stop the others being merged.
+
+        :param list names: Paths of the data files
+        :param obj read: Callable reading a list of paths
+        :return: tuple : (results of every successful call, names whose read raised)
+        """
+        try:
+            return [read(names)], []
+        except Exception:
+            pass
+        results = []
+        errors = []
+        for name in names:
+            try:
+                results.append(read([name]))
+            except Exception:
+                errors.append(name)
+        return results, errors
+
+    def __getstate__(self):
+        # Locks, the watch thread and the widget callbacks cannot be pickled, e.g. when the pipeline sends an analysis
+        # back from a worker
+        state = self.__dict__.copy()
+        for name in ('_lock', '_add_lock'):
+            del state[name]
+        state.update(watcher=None, _update_callbacks={})
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = _threading.RLock()
+        self._add_lock = _threading.Lock()
+
+    def on_update(self, callback, key=None):
+        """
+        Registers a callback called with the list of changed facet pairs every time add_files (or watch) merges new
+        files. The violin and heatmap widgets use it to refresh their facet lists.
+
+        :param obj callback: Callable taking the list of changed facet pairs
+        :param str key: Optional name of the view the callback refreshes. Registering again with the same key replaces
+                        the earlier callback, so a widget drawn again does not keep the old one refreshing.
+        :return: obj : The callback
+        """
+        self._update_callbacks[callback if key is None else key] = callback
+        return callback
+
+    def watch(self, interval=30, settle=10):
+        """
+        Follows data_path while an SSIM campaign is running. A background thread polls for new files and merges each
+        with add_files once it has stopped changing, so open violin and heatmap widgets pick up the new facet pairs.
+
+        :param float interval: Seconds between polls
+        :param float settle: Seconds a file must be unmodified before it is read
+        :return: obj : DirectoryWatcher
+        """
+        self.stop_watching()
+        self.watcher = _DirectoryWatcher(self.data_path, self.add_files, known=self._files, interval=interval,
+                                         settle=settle).start()
+        return self.watcher
+
+    def stop_watching(self):
+        """Stops the watch() thread, if any."""
+        if self.watcher is not None:
+            self.watcher.stop()
+            self.watcher = None
+
+    @property
+    def report(self):
+        """
+        Structured report of the last load and the cache lookups since, empty unless instrument was given.
+
+        :return: dict : 'stages' (stage, seconds, rows, bytes and peak_mb when tracing memory, in order of completion),
+                        'files' (file, facet, rows, file_bytes and bytes in memory of every file read), 'counters'
+                        (cache hits and misses, e.g. 'files.hit' for files served by cache_dir, 'cubes.miss') and
+                        'totals' per stage
+        """
+        return self.instrument.report
+
+    def _split_energy(self, energy):
+        """Returns the stored column of an energy and, for 'Weighted ...' energies, the probability of every pair."""
+        if energy.startswith('Weighted '):
+            return energy[len('Weighted '):], self.probabilities.to_numpy()
+        return energy, None
+
+    @_synchronised
+    def energy_values(self, energy, facet=None):
+        """
+        Values of an energy for every row, or for the rows of one facet pair. Weighted energies are computed here from
+        the unweighted column and the pair probabilities.
+
+        :param str energy: Energy column, e.g. 'Total Energy' or 'Weighted Total Energy'
+        :param str facet: Facet pair, or None for every row
+        :return: obj : 'ndarray'
+        """
+        column, scale = self._split_energy(energy)
+        values = self.data_all[column].to_numpy()
+        if facet is not None:
+            values = values[self.facet_index.rows(facet)]
+            if scale is not None:
+                values = values * values.dtype.type(self.probabilities[facet])
+        elif scale is not None:
+            values = values * scale.astype(values.dtype)[self.facet_index.codes]
+        return values
+
+    def _analyse_streaming(self, names, printing=False):
+        """Summarises the data files chunk by chunk into per facet pair statistics without building data_all."""
+        self.statistics = _stream_statistics(names, chunksize=self.chunksize, n_jobs=self.n_jobs)
+        self.failed_files = self.statistics.failed
+        for n in self.failed_files:
+            print("Failed on {} ".format(n))
+        facets = self.statistics.pairs
+        self._set_probabilities(facets, printing=printing)
+        self.col_options = _pd.Index(_ENERGIES + ['Weighted ' + col for col in _ENERGIES])
+        self.whole_list = _np.array(facets, dtype=object)
+        self._side_stats = {}
+        self.queries.clear()
+        print("Number of facet combinations : " + str(len(names)))
+
+    @_synchronised
+    def describe(self, energy='Total Energy'):
+        """
+        Summary statistics of one energy column over every facet pair, laid out like pandas describe().
+        In streaming mode the quartiles come from the quantile sketches.
+
+        :param str energy: Energy column, e.g. 'Total Energy' or 'Weighted Total Energy'
+        :return: obj : Series
+        """
+        def build():
+            if self.data_all is None:
+                return self.statistics.combined(self.whole_list, energy, self.probabilities.to_dict()).describe()
+            return _pd.Series(self.energy_values(energy), name=energy).describe()
+        return self.queries.get(('describe', energy), build, energies=[energy]).copy()
+
+    @property
+    def violin_data(self):
+        """Normalised interaction data. A view of data_all, not a copy."""
+        return self.data_all
+
+    @property
+    def weighted_data(self):
+        """Normalised interaction data with the 'Weighted' columns. The data_all columns are shared, the weighted ones
+        are computed on every access, so prefer energy_values or the statistics methods for repeated use."""
+        columns = {col: self.data_all[col] for col in self.data_all.columns}
+        columns.update(('Weighted ' + col, self.energy_values('Weighted ' + col)) for col in _ENERGIES)
+        return _pd.DataFrame(columns, copy=False)
+
+    @property
+    def heatmap_data(self):
+        """Interaction data with the displacement and rotation columns. A view of data_all, not a copy."""
+        return self.data_all
+
+    @_synchronised
+    def density(self, energy, facet=None, bw=0.2, gridsize=512):
+        """
+        Binned FFT kernel density estimate of an energy, cached per (energy, facet, bandwidth, gridsize).
+
+        :param str energy: Energy column
+        :param str facet: Facet pair, or None for every row
+        :param float bw: Bandwidth factor, as the bw of the violin and distribution plots
+        :param int gridsize: Number of grid points
+        :return: tuple : (grid, density)
+        """
+        return self._densities(energy, facet, bw=bw, gridsize=gridsize)
+
+    def _density_values(self, energy, facet):
+        """Values the density cache estimates from."""
+        return self.energy_values(energy, facet)
+
     def get_col_options(self, weighted=False):
         """Gets all col options based on if the weighted data has been enabled"""
+        return self.queries.get(('col_options', weighted is not False), lambda: self._col_options(weighted))
+
+    def _col_options(self, weighted):
         if weighted is False:
             col_options = self.col_options.drop(['Weighted Total Energy',
                                                  'Weighted Electrostatic',
@@ -172,10 +538,28 @@ class SSIMAnalyse:
 
     def get_facet_list(self, weighted=False):
         """Sorts the facet list based on mean of each facet-facet interaction"""
-        facet_list = self.violin_data.groupby('Facet')['Total Energy'].mean().sort_values().index
-        if weighted:
-            facet_list = self.weighted_data.groupby('Facet')['Weighted Total Energy'].mean().sort_values().index
-        return facet_list
+        energy = 'Weighted Total Energy' if weighted else 'Total Energy'
+
+        def build():
+            return self.pair_statistics(energy)['mean'].sort_values(kind='stable').index
+        return self.queries.get(('facet_list', bool(weighted)), build, energies=[energy])
+
+    @_synchronised
+    def pair_statistics(self, energy='Total Energy', median=False):
+        """
+        Count, mean, std (and median) of an energy for every facet pair.
+
+        :param str energy: Energy column, e.g. 'Total Energy' or 'Weighted Total Energy'
+        :param bool median: True also computes the median
+        :return: obj : Dataframe indexed by facet pair
+        """
+        def build():
+            if self.data_all is None:
+                stats = self.statistics.pair_table(energy, self.probabilities.to_dict())
+                return stats[['count', 'mean', 'std'] + (['median'] if median else [])]
+            column, scale = self._split_energy(energy)
+            return self.facet_index.pair_statistics(self.data_all[column].to_numpy(), median=median, scale=scale)
+        return self.queries.get(('pair_statistics', energy, median), build, energies=[energy]).copy()
 
     def violinplots(self, sort=True, weighted=False, ylimit=(-40, 0), title="",bw=0.2, inner=None, orient="v"):
         """Function that generates the widgets required for plotting Violin plots.
@@ -185,14 +569,21 @@ class SSIMAnalyse:
         :param bool weighted: Passes the True/False if the data is weighted by the size of the surface area.
         :param floats ylimit: Passes a list for scaling the y axis .
         :param str title: Passes the Title of the graph above the chart.
+        :param bw: Bandwidth factor of the KDE, or 'scott' or 'silverman'
+        :param str inner: None, 'box' or 'quartile'. Raises a ValueError for seaborn's 'stick' and 'point'.
         :return: Violin plots
         """
+        from ipywidgets import fixed, widgets
+        from lib import violinplots
+
+        violinplots.check_options(bw, inner)
+
+        # The densities are looked up by energy, so weighted violins need no weighted copy of the data
+        data = self.violin_data
         if weighted:
-            data = self.weighted_data
             print("Weighted data selected!")
         else:
             print("Normal Data")
-            data = self.violin_data
         facet_list = self.whole_list
 
         col_options = self.get_col_options(weighted=weighted)
@@ -204,54 +595,171 @@ class SSIMAnalyse:
             facet_list = self.get_facet_list(weighted=weighted)
 
         facet_list = widgets.SelectMultiple(options=facet_list, description='Facets Available', disabled=False)
+
+        def refresh(changed):
+            options = list(self.get_facet_list(weighted=weighted) if sort else self.whole_list)
+            selected = tuple(f for f in facet_list.value if f in options)
+            facet_list.options = options
+            facet_list.value = selected
+        self.on_update(refresh, key='violinplots')
         widgets.interact(violinplots.draw_violin,
                          data=fixed(data),
                          energy_comp=energy_comp,
                          energy_comp2=energy_comp2,
                          facet_list=facet_list,
                          ylimit=fixed(ylimit), title=fixed(title),
-                         bw=fixed(bw),inner=fixed(inner), orient=fixed(orient));
+                         bw=fixed(bw),inner=fixed(inner), orient=fixed(orient), densities=fixed(self.density));
+
+    @_synchronised
+    def energy_cube(self, facet, energy_comp):
+        """
+        Returns the dense rotation x Y x X energy cube of one facet pair and energy component.
+        Cubes are built on first use and kept until the data is re-analysed.
+
+        :param str facet: Facet pair, e.g. '100/011'
+        :param str energy_comp: Energy column
+        :return: obj : EnergyCube with the values and the rotation, Y and X coordinates
+        """
+        key = (facet, energy_comp)
+        cube = self._cubes.get(key)
+        self.instrument.count('cubes', cube is not None)
+        if cube is None:
+            cube = self._build_energy_cube(facet, energy_comp)
+            self._cubes[key] = cube
+        return cube
+
+    def _build_energy_cube(self, facet, energy_comp):
+        """Builds the energy cube of one facet pair without caching it."""
+        rows = self.facet_index.rows(facet)
+        data = self.data_all
+        return _build_cube(data['X axis Displacement'].to_numpy()[rows],
+                           data['Y axis Displacement'].to_numpy()[rows],
+                           data['Rotation'].to_numpy()[rows],
+                           self.energy_values(energy_comp, facet))
+
+    def build_cubes(self, energies=None, facets=None):
+        """
+        Builds the energy cubes ahead of time so every heatmap frame is a slice of an existing array.
+
+        :param list energies: Energy columns to build. Defaults to every column in col_options.
+        :param list facets: Facet pairs to build. Defaults to whole_list.
+        :return: dict : {(facet, energy): EnergyCube}
+        """
+        energies = self.col_options if energies is None else energies
+        facets = self.whole_list if facets is None else facets
+        for facet in facets:
+            for energy_comp in energies:
+                self.energy_cube(facet, energy_comp)
+        return self._cubes
+
+    @_synchronised
+    def binding_poses(self, k=5, energies=None):
+        """
+        The k strongest binding poses (lowest energies) of every facet pair, found with one grouped sort per energy.
+        Rank 1 is the global minimum of the pair.
+
+        :param int k: Number of poses per facet pair and energy
+        :param list energies: Energy columns to search. Defaults to every column in col_options.
+        :return: obj : Dataframe with Facet, Energy, Rank, X/Y displacement, Rotation and the energy
+        """
+        self._require_rows('binding_poses')
+        energies = list(self.col_options if energies is None else energies)
+        return _poses.top_poses(self.data_all, energies, k=k, probabilities=self.probabilities.to_numpy())
+
+    @_synchronised
+    def local_minima(self, energies=None, facets=None, rotation_period=360):
+        """
+        Every local minimum of the X x Y x rotation energy surface of each facet pair, i.e. the poses no higher than
+        any of their 26 grid neighbours. Rotation wraps around when the sampled rotations cover rotation_period.
+        Cubes already built by energy_cube are reused, the others are built and dropped again.
+
+        :param list energies: Energy columns to search. Defaults to every column in col_options.
+        :param list facets: Facet pairs to search. Defaults to whole_list.
+        :param float rotation_period: Period of the rotation axis in degrees
+        :return: obj : Dataframe with Facet, Energy, X/Y displacement, Rotation and the energy, lowest first per pair
+        """
+        self._require_rows('local_minima')
+        energies = list(self.col_options if energies is None else energies)
+        facets = self.whole_list if facets is None else facets
+        def get_cube(facet, energy):
+            cube = self._cubes.get((facet, energy))
+            return cube if cube is not None else self._build_energy_cube(facet, energy)
+
+        return _poses.local_minima(get_cube, facets, energies, rotation_period=rotation_period)
+
+    def _require_rows(self, method):
+        """Raises if the per-pose rows were not kept (streaming mode)."""
+        if self.data_all is None:
+            raise ValueError("{} needs the individual poses, which are not kept in streaming mode".format(method))
 
-    def heatmaps(self):
+    def heatmaps(self, max_cells=40000, pooling='min'):
         """Function that generates the widgets required for plotting HeatMaps.
-         This Function passes the information to the graph drawer which generates the image"""
-        animation = 1
-        slider=None
-        if animation < 1:
-            rot_slide = widgets.IntSlider(value=0, min=self.heatmap_data['Rotation'].min(),
-                                          max=self.heatmap_data['Rotation'].max(),
-                                          step=5, description='Set_Rotation', disabled=False,
-                                          continuous_update=False, orientation='horizontal', readout=True,
-                                          readout_format='d')
-        else:
-            rot_slide = widgets.Play(
-                interval=525,
-                value=0,
-                min=self.heatmap_data['Rotation'].min(),
-                max=self.heatmap_data['Rotation'].max(),
-                step=5,
-                description="Press play",
-                disabled=False
-            )
-            slider = widgets.IntSlider(value=0,
-                                       min=self.heatmap_data['Rotation'].min(),
-                                       max=self.heatmap_data['Rotation'].max(),
-                                       step=5, )
-            widgets.jslink((rot_slide, 'value'), (slider, 'value'))
-            widgets.HBox([rot_slide, slider])
+         The figure is drawn once and every widget change only updates the image and histogram in place.
+
+        :param int max_cells: Frames with more visible cells than this are block pooled before drawing. None disables it.
+        :param str pooling: 'min' keeps the minima visible when pooling, 'mean' averages each block
+        :return: obj : HeatmapView. Its export() method saves the frame on display at full resolution.
+        """
+        from IPython.display import clear_output, display
+        from ipywidgets import widgets
+        import matplotlib
+        from lib import heatmaps
+
+        rot_min = int(self.heatmap_data['Rotation'].min())
+        rot_max = int(self.heatmap_data['Rotation'].max())
+        rot_slide = widgets.Play(
+            interval=525,
+            value=rot_min,
+            min=rot_min,
+            max=rot_max,
+            step=5,
+            description="Press play",
+            disabled=False
+        )
+        slider = widgets.IntSlider(value=rot_min,
+                                   min=rot_min,
+                                   max=rot_max,
+                                   step=5, )
+        widgets.jslink((rot_slide, 'value'), (slider, 'value'))
 
         col_options = self.get_col_options(weighted=False)
         energy_comp = widgets.RadioButtons(options=col_options, description='Energy Components- Left Side',
                                            value='Total Energy')
-        #save_clicker = widgets.Button(description="Save Graph")
-        #display(save_clicker)
         facet_list = widgets.Dropdown(options=self.whole_list, description='Facets Avail', disabled=False)
-        figt = widgets.interact(heatmaps.drawheatmap,
-                                data=fixed(self.heatmap_data), energy_comp=energy_comp,
-                                rot_slide=rot_slide, slider=slider,
-                                facet_list=self.whole_list)
-
-    def cab_extraction(self, excipient, weighted=False, exp_probe=False, median=False):
+        out = widgets.Output()
+        view = heatmaps.HeatmapView(self.energy_cube, max_cells=max_cells, pooling=pooling)
+        inline = 'inline' in matplotlib.get_backend()
+
+        def update(change=None):
+            view.show(facet_list.value, energy_comp.value, slider.value)
+            if inline:  # Static backends need the updated figure re-sent, interactive ones redraw the canvas
+                with out:
+                    clear_output(wait=True)
+                    display(view.fig)
+
+        for w in (slider, energy_comp, facet_list):
+            w.observe(update, names='value')
+
+        def refresh(changed):
+            current = facet_list.value
+            facet_list.unobserve(update, names='value')
+            facet_list.options = list(self.whole_list)
+            facet_list.value = current
+            facet_list.observe(update, names='value')
+            if current in changed:  # The pair on display gained rows, so its cube is rebuilt
+                view.key = None
+                update()
+        self.on_update(refresh, key='heatmaps')
+
+        display(widgets.VBox([widgets.HBox([rot_slide, slider]), energy_comp, facet_list, out]))
+        if not inline:
+            with out:
+                display(view.fig.canvas)
+        update()
+        return view
+
+    def cab_extraction(self, excipient, weighted=False, exp_probe=False, median=False, bootstrap=0, ci=0.95,
+                       seed=None, n_jobs=1):
         """
         Method takes self to extract the data from the excipient substrates.
 
@@ -259,61 +767,114 @@ class SSIMAnalyse:
         :param bool weighted: True - will pass the energy as a function of the surface area per crystal.
         :param bool exp_probe:  True - Switch on if using Excipient as probe and the self. is an excipient object.
         :param bool median: True - Will pass back data as a median and not mean
+        :param int bootstrap: Number of bootstrap replicates. When set, percentile confidence intervals are added as
+                              'Adhesion CI Low/High' and 'Cohesion CI Low/High' columns, and the CAB gradient with its
+                              interval is kept in the table attrs as 'Gradient' and 'Gradient CI'.
+        :param float ci: Confidence level of the intervals
+        :param int seed: Seed of the resampling, for reproducible intervals. Without one the unseeded replicates of
+                         each object are drawn once and reused by later calls.
+        :param int n_jobs: Worker processes drawing the replicates, -1 for every core
         :return: df_data : Dataframe holding statistical data for the given probe and excipients
         """
 
         # Checks to see if the weighted attr has been applied to weight for the surface area of each facet as a factor
         # of contribution.
-        if weighted:
-            energy = 'Weighted Total Energy'
-            tempA = excipient.weighted_data
-            facet_list1 = excipient.whole_list
-            tempB = self.weighted_data
-            facet_list2 = self.whole_list
-        else:
-            energy = 'Total Energy'
-            tempA = excipient.violin_data
-            facet_list1 = excipient.whole_list
-            tempB = self.violin_data
-            facet_list2 = self.whole_list
+        energy = 'Weighted Total Energy' if weighted else 'Total Energy'
 
         probes = []
-        adh_energy = []
-        adh_std_energy = []
-        coh_energy = []
-        coh_std_energy = []
         for i in self.whole_list:
             t = i.split('/')
             if t[0] not in probes:
                 probes.append(t[0])
         # If the plots are set as excipient probe than the reverse of the probes are recorded
-        for x, layer in enumerate(probes):
-            if exp_probe:
-                tempT = tempA[tempA['Facet'].str.contains("/" + layer)][['Facet', energy]]
-            else:
-                tempT = tempA[tempA['Facet'].str.contains(layer + "/")][['Facet', energy]]
-            tempY = tempB[tempB['Facet'].str.contains(layer)][['Facet', energy]]
+        adhesion = excipient.side_statistics(energy, 'right' if exp_probe else 'left', median=median).reindex(probes)
+        cohesion = self.side_statistics(energy, 'either', median=median).reindex(probes)
 
-            # The mean is defaulted as the descriptor for the energies if median is passed it uses that.
-            if median:
-                adh_energy.append(tempT[energy].median())
-                coh_energy.append(tempY[energy].median())
+        # The mean is defaulted as the descriptor for the energies if median is passed it uses that.
+        descriptor = 'median' if median else 'mean'
+        df_hold = _pd.DataFrame({'Probes': probes,
+                                'Adhesion': adhesion[descriptor].to_numpy(),
+                                'Adhesion STD': adhesion['std'].to_numpy(),
+                                'Cohesion': cohesion[descriptor].to_numpy(),
+                                'Cohesion STD': cohesion['std'].to_numpy()})
+        df_hold.attrs['Gradient'] = float(_bootstrap.zero_intercept_slope(df_hold['Adhesion'], df_hold['Cohesion']))
+        if bootstrap:
+            # Replicate b of the adhesion is paired with replicate b of the cohesion for the gradient
+            # Unseeded replicates are drawn once per object and reused, seeded ones are cached per seed
+            if seed is None:
+                adhesion_seed = cohesion_seed = None
             else:
-                adh_energy.append(tempT[energy].mean())
-                coh_energy.append(tempY[energy].mean())
+                entropy = _np.random.SeedSequence(seed).entropy
+                adhesion_seed, cohesion_seed = [entropy, 0], [entropy, 1]
+            adhesion_reps = excipient.side_bootstrap(energy, 'right' if exp_probe else 'left', bootstrap,
+                                                     median=median, seed=adhesion_seed, n_jobs=n_jobs)
+            adhesion_reps = adhesion_reps.reindex(columns=probes)
+            cohesion_reps = self.side_bootstrap(energy, 'either', bootstrap, median=median, seed=cohesion_seed,
+                                                n_jobs=n_jobs).reindex(columns=probes)
+            for name, reps in (('Adhesion', adhesion_reps), ('Cohesion', cohesion_reps)):
+                low, high = _bootstrap.percentile_interval(reps.to_numpy(), ci)
+                df_hold[name + ' CI Low'] = low
+                df_hold[name + ' CI High'] = high
+            gradients = _bootstrap.zero_intercept_slope(adhesion_reps.to_numpy(), cohesion_reps.to_numpy())
+            df_hold.attrs['Gradient CI'] = tuple(float(g) for g in _bootstrap.percentile_interval(gradients, ci))
+            df_hold.attrs['CI'] = ci
+        return df_hold
 
-            adh_std_energy.append(tempT[energy].std())
-            coh_std_energy.append(tempY[energy].std())
+    @_synchronised
+    def side_statistics(self, energy, side, median=False):
+        """
+        Count, mean, std (and median) of an energy for every facet on one side of the facet pairs, by exact match.
+        Results are kept on the object so repeated CAB extractions against it are instant.
 
-        df_hold = _pd.DataFrame({'Probes': probes,
-                                'Adhesion': adh_energy,
-                                'Adhesion STD': adh_std_energy,
-                                'Cohesion': coh_energy,
-                                'Cohesion STD': coh_std_energy})
-        return df_hold
+        :param str energy: Energy column, e.g. 'Total Energy' or 'Weighted Total Energy'
+        :param str side: 'left', 'right' or 'either' side of the 'hkl1/hkl2' pairs
+        :param bool median: True also computes the median
+        :return: obj : Dataframe indexed by facet
+        """
+        key = (energy, side)
+        stats = self._side_stats.get(key)
+        self.instrument.count('side_statistics', stats is not None and (not median or 'median' in stats))
+        if stats is None or (median and 'median' not in stats):
+            if self.data_all is None:
+                stats = self.statistics.side_statistics(energy, side, median=median,
+                                                        probabilities=self.probabilities.to_dict())
+            else:
+                column, scale = self._split_energy(energy)
+                stats = self.facet_index.side_statistics(self.data_all[column].to_numpy(), side, median=median,
+                                                         scale=scale)
+            self._side_stats[key] = stats
+        return stats
+
+    @_synchronised
+    def side_bootstrap(self, energy, side, n_boot=1000, median=False, seed=None, n_jobs=1):
+        """
+        Bootstrap replicates of the mean (or median) of an energy for every facet on one side of the facet pairs.
+        Rows are resampled within each facet. Replicates are kept on the object per seed, so unseeded calls are
+        drawn once and then reused.
+
+        :param str energy: Energy column
+        :param str side: 'left', 'right' or 'either' side of the 'hkl1/hkl2' pairs
+        :param int n_boot: Number of replicates
+        :param bool median: True bootstraps the median
+        :param seed: Seed of the resampling
+        :param int n_jobs: Worker processes, -1 for every core
+        :return: obj : Dataframe of shape (n_boot, facets) with a column per facet
+        """
+        self._require_rows('side_bootstrap')
+        key = (energy, side, 'bootstrap', n_boot, median, None if seed is None else str(seed))
+        reps = self._side_stats.get(key)
+        self.instrument.count('side_bootstrap', reps is not None)
+        if reps is None:
+            rows, keys = self.facet_index.side_keys(side)
+            values = self.energy_values(energy)[rows]
+            reps = _pd.DataFrame(_bootstrap.bootstrap_groups(values, keys, len(self.facet_index.facets), n_boot,
+                                                             median=median, seed=seed, n_jobs=n_jobs),
+                                 columns=_pd.Index(self.facet_index.facets, name='Facet'))
+            self._side_stats[key] = reps
+        return reps
 
     def cabplots(self, excipient, weighted=False, exp_probe=False, median=False,
-                 title=None, label='APIvExp', xlim=(0, -10), ylim=(0, -10)):
+                 title=None, label='APIvExp', xlim=(0, -10), ylim=(0, -10), bootstrap=0, ci=0.95, seed=None, n_jobs=1):
         """
         This method takes the self as the probe and it uses the excipient (obj) provided to run the cab_extraction
         function which extacts the information from the probe/excipients for the statistical descriptor
@@ -326,11 +887,36 @@ class SSIMAnalyse:
         :param (str)    label       : Passes the labels for the excipients
         :param (floats) xlim        : Passes a list of two floats to set the x axis
         :param (floats) ylim        : Passes a list of two floats to set the y axis
+        :param (int)    bootstrap   : Number of bootstrap replicates, draws confidence intervals when set
+        :param (float)  ci          : Confidence level of the intervals
+        :param (int)    seed        : Seed of the resampling
+        :param (int)    n_jobs      : Worker processes drawing the replicates
         :return: Graph of CAB Plot
         """
-        data = self.cab_extraction(excipient=excipient, weighted=weighted, exp_probe=exp_probe, median=median)
+        data = self.cab_extraction(excipient=excipient, weighted=weighted, exp_probe=exp_probe, median=median,
+                                   bootstrap=bootstrap, ci=ci, seed=seed, n_jobs=n_jobs)
+        from lib import cabplots
         cabplots.drawcabplots(df_data=data, title=title, label=label, xlim=xlim, ylim=ylim)
 
+    def export(self, save_path=None, kinds=('heatmaps', 'violins', 'cabplots'), formats=('png',), animation='gif',
+               excipients=None, n_jobs=1, force=False, **kwargs):
+        """
+        Renders the heatmap frames and animations, violin panels and CAB plots to files on a non-interactive backend.
+        Outputs already newer than the data files are skipped.
+
+        :param str save_path: Output folder. Defaults to the save_path given to the object.
+        :param list kinds: Any of 'heatmaps', 'violins' and 'cabplots'
+        :param list formats: Image formats, any of 'png', 'svg' and 'pdf'
+        :param str animation: 'gif' or 'mp4' rotation animation for every heatmap, None to skip
+        :param dict excipients: {label: SSIMAnalyse} excipients for the CAB plots with this object as the probe
+        :param int n_jobs: Number of worker processes rendering the figures. -1 uses every core.
+        :param bool force: True renders everything even if it is up to date
+        :return: list : Names of the figures rendered
+        """
+        from lib import export as _export
+        return _export.export(self, save_path=save_path, kinds=kinds, formats=formats, animation=animation,
+                              excipients=excipients, n_jobs=n_jobs, force=force, **kwargs)
+
 
 def distributions(sets, labels, weighted=False, xlimit=(-10,0), kbw=0.2, tables=False, energy="Total Energy"):
     """ Function calculates the KDE of a  set of datasets and then plots them with labels.
@@ -344,9 +930,43 @@ def distributions(sets, labels, weighted=False, xlimit=(-10,0), kbw=0.2, tables=
     :param str energy   : Takes string of energy type options: " Total Energy" , "Electrostatic" , "Van der Waals", "H-Bond"
     :return: object     : Distribution Graph
     """
-    _dis.plot(sets=sets, labels=labels,
-                      weighted=weighted, xlimit=xlimit,
-                      kbw=kbw, tables=tables, energy=energy)
+    from lib import distribution as _dis
+    return _dis.plot(sets=sets, labels=labels,
+                     weighted=weighted, xlimit=xlimit,
+                     kbw=kbw, tables=tables, energy=energy)
+
+
+def cab_matrix(probes, excipients, probe_labels=None, excipient_labels=None, weighted=False, exp_probe=False,
+               median=False, n_jobs=1, bootstrap=0, ci=0.95, seed=None):
+    """ Function extracts the adhesion, cohesion and CAB ratio of every probe against every excipient.
+    The statistics of every object are computed once and reused for all of its pairs.
+
+    :param obj(s) probes        : List (or {label: object} dict) of the probe objects, typically the APIs
+    :param obj(s) excipients    : List (or {label: object} dict) of the excipient objects
+    :param str(s) probe_labels  : Labels of the probes, in the same order. Defaults to their data_path.
+    :param str(s) excipient_labels : Labels of the excipients, in the same order. Defaults to their data_path.
+    :param bool weighted        : True for having data weighted based on surface area present between the two surfaces
+    :param bool exp_probe       : True - Switch on if using Excipient as probe, see SSIMAnalyse.cab_extraction
+    :param bool median          : True - Will pass back data as a median and not mean
+    :param int n_jobs           : Number of threads working through the pairs
+    :param int bootstrap        : Number of bootstrap replicates for confidence intervals
+    :param float ci             : Confidence level of the intervals
+    :param int seed             : Seed of the resampling
+    :return: object             : Dataframe with a row per probe, excipient and probe facet
+    """
+    return _cab.cab_matrix(probes, excipients, probe_labels=probe_labels, excipient_labels=excipient_labels,
+                           weighted=weighted, exp_probe=exp_probe, median=median, n_jobs=n_jobs,
+                           bootstrap=bootstrap, ci=ci, seed=seed)
+
+
+def rank_excipients(matrix, ascending=True):
+    """ Function ranks the excipients of every probe by the CAB gradient of a cab_matrix table.
+
+    :param obj matrix     : Table returned by cab_matrix
+    :param bool ascending : True ranks the most adhesive excipient (lowest gradient) first
+    :return: object       : Dataframe with a row per probe and excipient, ranked within each probe
+    """
+    return _cab.rank_excipients(matrix, ascending=ascending)
 
 
 if __name__ == "__main__":